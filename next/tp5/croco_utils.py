@@ -101,6 +101,7 @@ def displayTrajectory(viz, xs, dt=0.01, rate=-1):
     :param xs: state trajectory
     :param dt: step duration
     :param rate: visualization rate
+    If the viewer is recording (see MeshcatVisualizer.recording), do not sleep.
     """
 
     import time
@@ -109,5 +110,6 @@ def displayTrajectory(viz, xs, dt=0.01, rate=-1):
     for i, x in enumerate(xs):
         if not i % S:
             viz.display(x[: viz.model.nq])
-            time.sleep(dt * S)
+            if getattr(viz, "recorder", None) is None:
+                time.sleep(dt * S)
     viz.display(xs[-1][: viz.model.nq])
@@ -0,0 +1,151 @@
+"""
+Broadphase culling of the collision pairs: the world axis-aligned bounding boxes
+(AABB) of the geometries are computed from their placements, the overlapping boxes
+are found by sweep and prune, and the (costly) hppfcl narrowphase is only run on the
+collision pairs whose boxes overlap.
+"""
+
+import numpy as np
+import pinocchio as pin
+
+
+class SweepAndPrune:
+    """
+    Broadphase for the collision pairs of <geom_model>, e.g. the robot of
+    load_ur5_with_obstacles:
+        sap = SweepAndPrune(robot.collision_model)
+        sap.computeCollisions(robot.model, robot.data, robot.collision_data, q)
+    gives the same answer as pin.computeCollisions, while only calling hppfcl on the
+    pairs returned by candidates().
+
+    >>> from supaero2024.load_ur5_with_obstacles import load_ur5_with_obstacles
+    >>> robot = load_ur5_with_obstacles()
+    >>> sap = SweepAndPrune(robot.collision_model)
+    >>> model, data = robot.model, robot.data
+    >>> gmodel, gdata = robot.collision_model, robot.collision_data
+    >>> qs = np.random.default_rng(0).uniform(-3.2, 3.2, [50, robot.nq])
+    >>> all(
+    ...     sap.computeCollisions(model, data, gdata, q)
+    ...     == pin.computeCollisions(model, data, gmodel, gdata, q, False)
+    ...     for q in qs
+    ... )
+    True
+    >>> len(sap.candidates(gdata)) < len(gmodel.collisionPairs)
+    True
+    >>> q = next(q for q in qs if sap.computeCollisions(model, data, gdata, q))
+    >>> for k in range(len(gmodel.collisionPairs)):
+    ...     gdata.deactivateCollisionPair(k)
+    >>> sap.computeCollisions(model, data, gdata, q)
+    False
+
+    Unbounded shapes, e.g. the floor of tp4/scenes.addFloor, are always checked:
+    >>> import hppfcl
+    >>> model = pin.Model()
+    >>> _ = model.addJoint(0, pin.JointModelPZ(), pin.SE3.Identity(), "z")
+    >>> gmodel = pin.GeometryModel()
+    >>> for name, joint, shape in [
+    ...     ("floor", 0, hppfcl.Halfspace(np.array([0, 0, 1.0]), 0)),
+    ...     ("ball", 1, hppfcl.Sphere(0.1)),
+    ... ]:
+    ...     g = pin.GeometryObject(
+    ...         name,
+    ...         parent_joint=joint,
+    ...         collision_geometry=shape,
+    ...         placement=pin.SE3.Identity(),
+    ...     )
+    ...     _ = gmodel.addGeometryObject(g)
+    >>> gmodel.addCollisionPair(pin.CollisionPair(0, 1))
+    >>> sap = SweepAndPrune(gmodel)
+    >>> data, gdata = model.createData(), pin.GeometryData(gmodel)
+    >>> [
+    ...     sap.computeCollisions(model, data, gdata, np.array([z]))
+    ...     for z in [1.0, 0.05, -0.5]
+    ... ]
+    [False, True, True]
+    """
+
+    def __init__(self, geom_model):
+        self.geom_model = geom_model
+        n = geom_model.ngeoms
+        # Local AABB of each geometry, as center and half extents.
+        self.center = np.zeros([n, 3])
+        self.half = np.zeros([n, 3])
+        # Unbounded shapes (e.g. hppfcl.Halfspace) have an infinite local AABB (or
+        # one spanning the whole range of the floats), which cannot be swept: they
+        # keep a null box, and all their pairs are always candidates.
+        unbounded = np.zeros(n, dtype=bool)
+        for i, g in enumerate(geom_model.geometryObjects):
+            g.geometry.computeLocalAABB()
+            box = g.geometry.aabb_local
+            lo, hi = np.array(box.min_), np.array(box.max_)
+            with np.errstate(over="ignore", invalid="ignore"):
+                unbounded[i] = not np.isfinite([lo, hi, hi - lo]).all()
+            if not unbounded[i]:
+                self.center[i] = (lo + hi) / 2
+                self.half[i] = (hi - lo) / 2
+        # pairIndex[i,j] is the index of the collision pair (i,j), or -1.
+        self.pairIndex = np.full([n, n], -1)
+        for k, pair in enumerate(geom_model.collisionPairs):
+            self.pairIndex[pair.first, pair.second] = k
+            self.pairIndex[pair.second, pair.first] = k
+        self.unboundedPairs = np.array(
+            [
+                k
+                for k, pair in enumerate(geom_model.collisionPairs)
+                if unbounded[pair.first] or unbounded[pair.second]
+            ],
+            dtype=int,
+        )
+
+    def aabbs(self, geom_data):
+        """
+        Return the (n,3) lower and upper corners of the world AABBs of the
+        geometries, from their placements geom_data.oMg.
+        """
+        R = np.array([M.rotation for M in geom_data.oMg])
+        p = np.array([M.translation for M in geom_data.oMg])
+        center = np.einsum("nij,nj->ni", R, self.center) + p
+        half = np.einsum("nij,nj->ni", np.abs(R), self.half)
+        return center - half, center + half
+
+    def candidates(self, geom_data):
+        """
+        Return the indexes of the collision pairs whose world AABBs overlap, found
+        by sweeping the boxes sorted along the X axis, and of the pairs involving an
+        unbounded shape.
+        """
+        lo, hi = self.aabbs(geom_data)
+        order = np.argsort(lo[:, 0])
+        los, his = lo[order], hi[order]
+        # The boxes after i in the sorted list, and starting before i ends along X.
+        end = np.searchsorted(los[:, 0], his[:, 0], side="right")
+        counts = end - np.arange(len(order)) - 1
+        a = np.repeat(np.arange(len(order)), counts)
+        first = np.cumsum(counts) - counts
+        b = a + 1 + np.arange(len(a)) - np.repeat(first, counts)
+        overlap = np.all(
+            (los[a, 1:] <= his[b, 1:]) & (los[b, 1:] <= his[a, 1:]), axis=1
+        )
+        pairs = self.pairIndex[order[a[overlap]], order[b[overlap]]]
+        return np.union1d(pairs[pairs >= 0], self.unboundedPairs)
+
+    def computeCollisions(
+        self, model, data, geom_data, q=None, stop_at_first_collision=False
+    ):
+        """
+        Same as pin.computeCollisions(model, data, geom_model, geom_data, q,
+        stop_at_first_collision): update the geometry placements (if <q> is given)
+        and return True if any active collision pair is in collision. Only the
+        collision results of the active candidate pairs are updated.
+        """
+        if q is not None:
+            pin.updateGeometryPlacements(model, data, self.geom_model, geom_data, q)
+        collision = False
+        for k in map(int, self.candidates(geom_data)):
+            if not geom_data.activeCollisionPairs[k]:
+                continue
+            if pin.computeCollision(self.geom_model, geom_data, k):
+                collision = True
+                if stop_at_first_collision:
+                    break
+        return collision
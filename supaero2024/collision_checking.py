@@ -0,0 +1,343 @@
+"""
+Batched collision checking for sampling-based planning, e.g. on the robot built by
+load_ur5_with_obstacles. A whole (N,nq) array of configurations is checked at once,
+possibly in parallel on a pool of model/data copies, instead of calling
+pin.updateGeometryPlacements and pin.computeCollisions once per configuration.
+"""
+
+import functools
+import os
+
+import numpy as np
+import pinocchio as pin
+
+from .broadphase import SweepAndPrune
+
+# Joints whose configuration is a vector of the velocity space, rotating the
+# geometries around the joint origin, or translating them.
+ROTATION_JOINTS = {
+    "JointModelRX",
+    "JointModelRY",
+    "JointModelRZ",
+    "JointModelRevoluteUnaligned",
+    "JointModelSphericalZYX",
+}
+TRANSLATION_JOINTS = {
+    "JointModelPX",
+    "JointModelPY",
+    "JointModelPZ",
+    "JointModelPrismaticUnaligned",
+    "JointModelTranslation",
+}
+
+
+def displacementBounds(model, geom_model):
+    """
+    Return the (ngeoms,nv) array B such that moving the configuration by dq moves
+    any point of the geometry g by at most B[g] @ |dq|, B[g,j] being the largest
+    distance from the axis of joint j to the geometry g (0 if j does not carry g).
+    The bound is computed for chains of revolute (or spherical ZYX) joints, the
+    prismatic (or translation) joints being counted for 1 m/m. A prismatic joint
+    below a revolute joint lengthens its lever arm by its whole stroke, so it must
+    have finite position limits. The other joints, whose configuration is not a
+    vector of the velocity space (e.g. free flyer), are not supported.
+
+    >>> model = pin.buildSampleModelHumanoid()
+    >>> displacementBounds(model, pin.buildSampleGeometryModelHumanoid(model))
+    Traceback (most recent call last):
+        ...
+    NotImplementedError: displacementBounds does not support JointModelFreeFlyer
+
+    For a ball at the end of a prismatic joint (stroke [-2,2]) carried by a revolute
+    joint, the lever arm of the revolute joint is up to 2.1 m:
+    >>> import hppfcl
+    >>> model = pin.Model()
+    >>> rz = model.addJoint(0, pin.JointModelRZ(), pin.SE3.Identity(), "rz")
+    >>> px = model.addJoint(
+    ...     rz,
+    ...     pin.JointModelPX(),
+    ...     pin.SE3.Identity(),
+    ...     "px",
+    ...     max_effort=np.ones(1),
+    ...     max_velocity=np.ones(1),
+    ...     min_config=np.array([-2.0]),
+    ...     max_config=np.array([2.0]),
+    ... )
+    >>> gmodel = pin.GeometryModel()
+    >>> _ = gmodel.addGeometryObject(
+    ...     pin.GeometryObject(
+    ...         "ball",
+    ...         parent_joint=px,
+    ...         collision_geometry=hppfcl.Sphere(0.1),
+    ...         placement=pin.SE3.Identity(),
+    ...     )
+    ... )
+    >>> B = displacementBounds(model, gmodel)
+    >>> B
+    array([[2.1, 1. ]])
+    >>> data, gdata = model.createData(), pin.GeometryData(gmodel)
+    >>> def position(q):
+    ...     pin.updateGeometryPlacements(model, data, gmodel, gdata, q)
+    ...     return gdata.oMg[0].translation.copy()
+    >>> q, dq = np.array([0, 2.0]), np.array([0.1, 0])
+    >>> round(float(np.linalg.norm(position(q + dq) - position(q))), 4)
+    0.1999
+    >>> round(float(B[0] @ np.abs(dq)), 4)
+    0.21
+    >>> model.upperPositionLimit[1] = np.inf
+    >>> displacementBounds(model, gmodel)
+    Traceback (most recent call last):
+        ...
+    NotImplementedError: displacementBounds needs bounded prismatic joints below rz
+    """
+    B = np.zeros([geom_model.ngeoms, model.nv])
+    for ig, g in enumerate(geom_model.geometryObjects):
+        if g.parentJoint == 0:  # Static geometry
+            continue
+        g.geometry.computeLocalAABB()
+        reach = np.linalg.norm(g.placement.act(g.geometry.aabb_center))
+        reach += g.geometry.aabb_radius
+        j = g.parentJoint
+        while j > 0:
+            joint = model.joints[j]
+            name = joint.shortname()
+            if name in ROTATION_JOINTS:
+                if not np.isfinite(reach):
+                    raise NotImplementedError(
+                        "displacementBounds needs bounded prismatic joints below %s"
+                        % model.names[j]
+                    )
+                bound = reach
+            elif name in TRANSLATION_JOINTS:
+                bound = 1.0
+                # The joint moves the geometry by up to its stroke.
+                lower = model.lowerPositionLimit[joint.idx_q : joint.idx_q + joint.nq]
+                upper = model.upperPositionLimit[joint.idx_q : joint.idx_q + joint.nq]
+                with np.errstate(over="ignore"):
+                    reach += np.linalg.norm(np.maximum(np.abs(lower), np.abs(upper)))
+            else:
+                raise NotImplementedError(
+                    "displacementBounds does not support %s" % name
+                )
+            B[ig, joint.idx_v : joint.idx_v + joint.nv] = bound
+            reach += np.linalg.norm(model.jointPlacements[j].translation)
+            j = model.parents[j]
+    return B
+
+
+def collisionDistanceGradient(model, data, geom_model, geom_data, q):
+    """
+    Return the gradient (nv) of the distance of the closest collision pair at
+    <q>, as computed by pin.computeDistances. The distance of the pair is
+    d = n.(p2-p1), with p1,p2 the witness points and n the normal. It varies as
+    n.(v2-v1), with v1,v2 the velocities of the witness points, moving with the
+    joints supporting their geometries.
+
+    >>> from supaero2024.load_ur5_with_obstacles import load_ur5_with_obstacles
+    >>> robot = load_ur5_with_obstacles(reduced=True)
+    >>> args = robot.model, robot.data, robot.collision_model, robot.collision_data
+    >>> def distance(q):
+    ...     pin.updateGeometryPlacements(*args, q)
+    ...     idx = pin.computeDistances(robot.collision_model, robot.collision_data)
+    ...     return robot.collision_data.distanceResults[idx].min_distance
+    >>> q, dq = np.array([0.3, -0.5]), np.array([1e-6, 0])
+    >>> fd = (distance(q + dq) - distance(q - dq)) / 2e-6
+    >>> bool(abs(collisionDistanceGradient(*args, q)[0] - fd) < 1e-4)
+    True
+    """
+    pin.computeJointJacobians(model, data, q)
+    pin.updateGeometryPlacements(model, data, geom_model, geom_data)
+    idx = pin.computeDistances(geom_model, geom_data)
+    res = geom_data.distanceResults[idx]
+    pair = geom_model.collisionPairs[idx]
+    grad = np.zeros(model.nv)
+    for geom, point, sign in [
+        (pair.first, res.getNearestPoint1(), -1),
+        (pair.second, res.getNearestPoint2(), +1),
+    ]:
+        joint = geom_model.geometryObjects[geom].parentJoint
+        if joint == 0:  # Obstacles do not move
+            continue
+        J = pin.getJointJacobian(model, data, joint, pin.LOCAL_WORLD_ALIGNED)
+        lever = point - data.oMi[joint].translation
+        grad += sign * res.normal @ (J[:3] - pin.skew(lever) @ J[3:])
+    return grad
+
+
+class CollisionChecker:
+    """
+    Check the collisions of the configurations of <robot> (a RobotWrapper with model
+    and collision_model, typically from load_ur5_with_obstacles). The collision
+    pairs are those of the collision model. The models are copied at construction,
+    so later modifications of the robot are not taken into account.
+
+    If Pinocchio provides a GeometryPool (pinocchio >= 3 built with OpenMP), the
+    configurations are dispatched on <nthreads> threads (default to the number of
+    CPUs), each one working on its own Data and GeometryData. Otherwise they are
+    checked one after the other. If <broadphase> is True, they are also checked one
+    after the other, but the narrowphase is only run on the pairs whose bounding
+    boxes overlap (see SweepAndPrune), which pays off for scenes with many
+    obstacles.
+
+    >>> from supaero2024.load_ur5_with_obstacles import load_ur5_with_obstacles
+    >>> robot = load_ur5_with_obstacles(reduced=True)
+    >>> checker = CollisionChecker(robot)
+    >>> qs = np.random.default_rng(0).uniform(-3.2, 3.2, [200, 2])
+    >>> mask = checker(qs)
+    >>> mask.shape, mask.dtype
+    ((200,), dtype('bool'))
+    >>> bool(mask.any() and not mask.all())
+    True
+    >>> all(mask[i] == checker.collide(q) for i, q in enumerate(qs[:20]))
+    True
+    >>> bool((CollisionChecker(robot, broadphase=True)(qs) == mask).all())
+    True
+
+    The distance to the obstacles certifies a free neighborhood of a configuration
+    (see displacementBounds):
+    >>> q = qs[~mask][0]
+    >>> dq = np.array([1.0, -1.0])
+    >>> dq *= 0.99 * checker.distance(q) / (checker.bounds @ np.abs(dq))
+    >>> bool(checker(q + np.linspace(0, 1, 20)[:, None] * dq).any())
+    False
+    >>> checker.validSegment(q, q + dq)
+    True
+    >>> checker.validSegment(q, qs[mask][0])
+    False
+
+    The bounds are only computed when needed, so that any robot can be checked:
+    >>> model = pin.buildSampleModelHumanoid()
+    >>> humanoid = pin.RobotWrapper(
+    ...     model, pin.buildSampleGeometryModelHumanoid(model), pin.GeometryModel()
+    ... )
+    >>> humanoid.collision_model.addAllCollisionPairs()
+    >>> checker = CollisionChecker(humanoid)
+    >>> checker(np.array([pin.neutral(model)])).shape
+    (1,)
+    >>> checker.bounds
+    Traceback (most recent call last):
+        ...
+    NotImplementedError: displacementBounds does not support JointModelFreeFlyer
+    """
+
+    def __init__(self, robot, nthreads=None, broadphase=False):
+        self.model = robot.model.copy()
+        self.collision_model = robot.collision_model.copy()
+        self.data = self.model.createData()
+        self.collision_data = pin.GeometryData(self.collision_model)
+        self.pairs = np.array(
+            [[p.first, p.second] for p in self.collision_model.collisionPairs]
+        ).reshape(-1, 2)
+        self.nthreads = nthreads or os.cpu_count() or 1
+        self.broadphase = SweepAndPrune(self.collision_model) if broadphase else None
+        if hasattr(pin, "GeometryPool") and not broadphase:
+            self.pool = pin.GeometryPool(
+                self.model, self.collision_model, self.nthreads
+            )
+        else:
+            self.pool = None
+
+    @functools.cached_property
+    def geometryBounds(self):
+        """
+        Bounds of the displacement of each geometry (see displacementBounds),
+        computed on first use, as only validSegment and the certificates of the
+        planners need them.
+        """
+        return displacementBounds(self.model, self.collision_model)
+
+    @functools.cached_property
+    def bounds(self):
+        """Bound of the relative displacement of the geometries of any pair."""
+        B = self.geometryBounds
+        return (B[self.pairs[:, 0]] + B[self.pairs[:, 1]]).max(axis=0, initial=0)
+
+    def collide(self, q):
+        """Return True if the configuration <q> is in collision."""
+        if self.broadphase is not None:
+            return self.broadphase.computeCollisions(
+                self.model, self.data, self.collision_data, q, True
+            )
+        pin.updateGeometryPlacements(
+            self.model, self.data, self.collision_model, self.collision_data, q
+        )
+        return pin.computeCollisions(self.collision_model, self.collision_data, True)
+
+    def distance(self, q):
+        """
+        Return the minimal distance between the robot and the obstacles (the
+        collisionDistance of tp0), null or negative in case of collision.
+        """
+        pin.updateGeometryPlacements(
+            self.model, self.data, self.collision_model, self.collision_data, q
+        )
+        idx = pin.computeDistances(self.collision_model, self.collision_data)
+        return self.collision_data.distanceResults[idx].min_distance
+
+    def validSegment(self, qa, qb, margin=1e-3, maxsteps=1000):
+        """
+        Return True if the straight segment from <qa> to <qb> is free of collision,
+        by conservative advancement: at a configuration where the pair of geometries
+        (g1,g2) is at distance d, the configuration can move by dq as long as
+        (B[g1] + B[g2]) @ |dq| < d for all pairs (see displacementBounds), so the
+        segment is traversed by such provably safe steps, alternately from both
+        ends until they meet. Unlike a check at a fixed resolution, this is sound:
+        the segment is declared in collision as soon as a distance falls below
+        <margin> (or after <maxsteps> steps).
+        """
+        qa, qb = np.asarray(qa, dtype=float), np.asarray(qb, dtype=float)
+        B, pairs = self.geometryBounds, self.pairs
+        # Bound of the relative motion of each pair along the whole segment.
+        move = (B[pairs[:, 0]] + B[pairs[:, 1]]) @ np.abs(qb - qa)
+        move = np.maximum(move, 1e-12)
+        ta, tb = 0.0, 1.0
+        for i in range(maxsteps):
+            t = ta if i % 2 == 0 else tb
+            pin.updateGeometryPlacements(
+                self.model,
+                self.data,
+                self.collision_model,
+                self.collision_data,
+                qa + t * (qb - qa),
+            )
+            pin.computeDistances(self.collision_model, self.collision_data)
+            d = np.array([r.min_distance for r in self.collision_data.distanceResults])
+            if d.min() <= margin:
+                return False
+            if i % 2 == 0:
+                ta += np.min(d / move)
+            else:
+                tb -= np.min(d / move)
+            if ta >= tb:
+                return True
+        return False
+
+    def __call__(self, qs):
+        """
+        Return the N-length boolean mask of the configurations of the (N,nq) array
+        <qs> which are in collision.
+        """
+        qs = np.atleast_2d(np.asarray(qs, dtype=float))
+        if len(qs) == 0:
+            return np.zeros(0, dtype=bool)
+        if self.pool is None:
+            return np.array([self.collide(q) for q in qs], dtype=bool)
+        # Pinocchio expects one configuration per column.
+        res = pin.computeCollisionsInParallel(
+            self.nthreads, self.pool, np.asfortranarray(qs.T), True
+        )
+        return np.asarray(res, dtype=bool)
+
+    def sampleFree(self, n, low=-3.2, high=3.2, rng=np.random):
+        """
+        Return a (n,nq) array of random collision-free configurations, uniformly
+        sampled between <low> and <high> (scalars or nq-vectors) by batches.
+        """
+        free = []
+        count = 0
+        while count < n:
+            qs = rng.uniform(low, high, [max(n - count, 16), self.model.nq])
+            qs = qs[~self(qs)]
+            free.append(qs)
+            count += len(qs)
+        return np.concatenate(free)[:n]
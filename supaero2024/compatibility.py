@@ -0,0 +1,33 @@
+"""
+Accessors hiding the API differences between Pinocchio 2.6 (as pinned in
+poetry.lock) and Pinocchio 3: pin.Frame.parent and pin.Frame.previousFrame were
+renamed parentJoint and parentFrame.
+"""
+
+
+def frameParentJoint(frame):
+    """
+    Return the index of the parent joint of <frame> (a pin.Frame).
+
+    >>> import pinocchio as pin
+    >>> model = pin.buildSampleModelManipulator()
+    >>> model.names[frameParentJoint(model.frames[-1])]
+    'wrist2_joint'
+    """
+    if hasattr(frame, "parentJoint"):
+        return frame.parentJoint
+    return frame.parent
+
+
+def frameParentFrame(frame):
+    """
+    Return the index of the parent frame of <frame> (a pin.Frame).
+
+    >>> import pinocchio as pin
+    >>> model = pin.buildSampleModelManipulator()
+    >>> model.frames[frameParentFrame(model.frames[-1])].name
+    'wrist2_joint'
+    """
+    if hasattr(frame, "parentFrame"):
+        return frame.parentFrame
+    return frame.previousFrame
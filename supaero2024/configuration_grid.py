@@ -0,0 +1,180 @@
+"""
+Precomputed grid of a 2D configuration space, typically the one of
+load_ur5_with_obstacles(reduced=True). The collision flag, the distance to the
+obstacles and the distance to a target are computed once on a regular grid, can be
+saved to disk and reloaded as memory maps, and are then looked up in O(1) instead
+of calling hppfcl.
+"""
+
+import os
+
+import numpy as np
+import pinocchio as pin
+
+from .collision_checking import CollisionChecker
+
+FIELDS = ["collision", "obstacle_distance", "target_distance"]
+
+
+class ConfigurationGrid:
+    """
+    Values sampled on the regular grid of <shape>=(n1,n2) nodes spanning the box
+    [<lower>,<upper>] of the 2D configuration space. Node (i,j) is the configuration
+    lower + (i,j) * step. The arrays (indexed by [i,j]) are:
+    - collision: 1 if the configuration is in collision, 0 otherwise,
+    - obstacle_distance: the minimal distance between the robot and the obstacles
+      (0 for the configurations in collision),
+    - target_distance: the distance between the end effector and the target (or
+      NaN if no target was given).
+
+    >>> from supaero2024.load_ur5_with_obstacles import load_ur5_with_obstacles
+    >>> robot = load_ur5_with_obstacles(reduced=True)
+    >>> grid = ConfigurationGrid.build(robot, target=[0.5, 0.5], resolution=11)
+    >>> grid.collision.shape
+    (11, 11)
+    >>> q = grid.configuration(3, 4)
+    >>> bool(grid.collide(q)) == CollisionChecker(robot).collide(q)
+    True
+    >>> bool(np.isclose(grid.obstacleDistance(q), grid.obstacle_distance[3, 4]))
+    True
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as dirname:
+    ...     grid.save(dirname)
+    ...     loaded = ConfigurationGrid.load(dirname)
+    ...     bool(np.allclose(loaded.targetDistance(q), grid.targetDistance(q)))
+    True
+    """
+
+    def __init__(self, lower, upper, collision, obstacle_distance, target_distance):
+        self.collision = collision
+        self.obstacle_distance = obstacle_distance
+        self.target_distance = target_distance
+        self.lower = np.array(lower, dtype=float)
+        self.upper = np.array(upper, dtype=float)
+        self.shape = np.array(collision.shape)
+        self.step = (self.upper - self.lower) / (self.shape - 1)
+
+    @classmethod
+    def build(
+        cls, robot, target=None, resolution=200, lower=-3.2, upper=3.2, frame=None
+    ):
+        """
+        Rasterize the configuration space of the 2-dof <robot> with <resolution> nodes
+        per axis (int or pair). The distance to the 2D <target> (in the X,Z plane,
+        as tp0 Target) is measured from the frame <frame> (default to the last
+        frame of the model).
+        """
+        lower = np.broadcast_to(np.array(lower, dtype=float), [2])
+        upper = np.broadcast_to(np.array(upper, dtype=float), [2])
+        shape = np.broadcast_to(np.array(resolution, dtype=int), [2])
+        axes = [np.linspace(lo, up, n) for lo, up, n in zip(lower, upper, shape)]
+        qs = np.stack(np.meshgrid(*axes, indexing="ij"), -1).reshape(-1, 2)
+
+        checker = CollisionChecker(robot)
+        collision = checker(qs)
+        model, data = checker.model, checker.data
+        geom_model, geom_data = checker.collision_model, checker.collision_data
+        frame = model.nframes - 1 if frame is None else frame
+        distance = np.zeros(len(qs))
+        effector = np.zeros([len(qs), 2])
+        for k, q in enumerate(qs):
+            pin.framesForwardKinematics(model, data, q)
+            effector[k] = data.oMf[frame].translation[[0, 2]]
+            if collision[k]:  # The distance queries are by far the most costly.
+                continue
+            pin.updateGeometryPlacements(model, data, geom_model, geom_data)
+            idx = pin.computeDistances(geom_model, geom_data)
+            distance[k] = geom_data.distanceResults[idx].min_distance
+        if target is None:
+            target_distance = np.full(len(qs), np.nan)
+        else:
+            target_distance = np.linalg.norm(effector - target, axis=1)
+
+        return cls(
+            lower,
+            upper,
+            collision.reshape(shape).astype(np.uint8),
+            distance.reshape(shape),
+            target_distance.reshape(shape),
+        )
+
+    def save(self, dirname):
+        """Save the grid as .npy files in the directory <dirname>."""
+        os.makedirs(dirname, exist_ok=True)
+        np.save(os.path.join(dirname, "bounds.npy"), [self.lower, self.upper])
+        for field in FIELDS:
+            np.save(os.path.join(dirname, field + ".npy"), getattr(self, field))
+
+    @classmethod
+    def load(cls, dirname, mmap_mode="r"):
+        """Load a grid saved by save(), the arrays being memory-mapped from disk."""
+        lower, upper = np.load(os.path.join(dirname, "bounds.npy"))
+        arrays = [
+            np.load(os.path.join(dirname, field + ".npy"), mmap_mode=mmap_mode)
+            for field in FIELDS
+        ]
+        return cls(lower, upper, *arrays)
+
+    def configuration(self, i, j):
+        """Return the configuration of the node (i,j)."""
+        return self.lower + np.array([i, j]) * self.step
+
+    def _coordinates(self, qs):
+        """Return the continuous grid coordinates of the configurations <qs>,
+        clipped to the grid."""
+        u = (np.asarray(qs, dtype=float) - self.lower) / self.step
+        return np.clip(u, 0, self.shape - 1)
+
+    def collide(self, qs):
+        """
+        Return the collision flag of the node nearest to <qs> (a configuration, or
+        a (N,2) array of configurations).
+        """
+        i, j = np.moveaxis(np.rint(self._coordinates(qs)).astype(int), -1, 0)
+        return self.collision[i, j].astype(bool)
+
+    def interpolate(self, values, qs):
+        """
+        Return the bilinear interpolation of the grid array <values> at <qs> (a
+        configuration, or a (N,2) array of configurations).
+        """
+        u = self._coordinates(qs)
+        # The lower corner of the cell, such that the upper corner is in the grid.
+        ij = np.minimum(np.floor(u).astype(int), self.shape - 2)
+        f = u - ij
+        i, j = np.moveaxis(ij, -1, 0)
+        fi, fj = np.moveaxis(f, -1, 0)
+        return (
+            values[i, j] * (1 - fi) * (1 - fj)
+            + values[i + 1, j] * fi * (1 - fj)
+            + values[i, j + 1] * (1 - fi) * fj
+            + values[i + 1, j + 1] * fi * fj
+        )
+
+    def obstacleDistance(self, qs):
+        """Interpolated distance to the obstacles, see interpolate()."""
+        return self.interpolate(self.obstacle_distance, qs)
+
+    def targetDistance(self, qs):
+        """Interpolated distance to the target, see interpolate()."""
+        return self.interpolate(self.target_distance, qs)
+
+    def plot(self):
+        """
+        Plot the distance to the target and the distance to the obstacles, as
+        plotConfigurationSpace in tp0 (collisions in white).
+        """
+        import matplotlib.pylab as plt
+
+        extent = [self.lower[0], self.upper[0], self.lower[1], self.upper[1]]
+        for k, (values, title) in enumerate(
+            [
+                (self.target_distance, "Distance to the target"),
+                (self.obstacle_distance, "Distance to the obstacles"),
+            ]
+        ):
+            plt.subplot(2, 1, k + 1)
+            masked = np.ma.masked_where(np.asarray(self.collision) > 0, values)
+            plt.imshow(masked.T, origin="lower", extent=extent, aspect="auto")
+            plt.title(title)
+            plt.colorbar()
@@ -2,10 +2,131 @@ import numpy as np
 import pinocchio as pin
 from example_robot_data import load
 
-
-def load_ur5_parallel():
+from .compatibility import frameParentFrame, frameParentJoint
+from .scene import Scene
+
+# Vectors of the model indexed by the configuration or velocity (limits, friction,
+# etc), the ones missing in the installed Pinocchio being skipped.
+JOINT_VECTORS = [
+    "lowerPositionLimit",
+    "upperPositionLimit",
+    "positionLimitMargin",
+    "effortLimit",
+    "lowerEffortLimit",
+    "upperEffortLimit",
+    "velocityLimit",
+    "lowerVelocityLimit",
+    "upperVelocityLimit",
+    "friction",
+    "lowerDryFrictionLimit",
+    "upperDryFrictionLimit",
+    "damping",
+    "armature",
+    "rotorInertia",
+    "rotorGearRatio",
+]
+
+
+def assemble(model, geom_models, placements):
+    """
+    Assemble copies of the kinematic <model> (and of its list of <geom_models>),
+    the base of copy #i being placed at <placements>[i]. The joints, frames and
+    geometries of copy #i are suffixed by "_#i". Return the full model and the list
+    of full geometry models.
+    The full model is built in one pass, the joint and frame indexes of the copies
+    being remapped with precomputed tables, instead of calling pin.appendModel and
+    looking the parents up by name for each geometry.
+
+    >>> robot = load("ur5")
+    >>> placements = [pin.SE3.Random() for _ in range(3)]
+    >>> full, [vfull] = assemble(robot.model, [robot.visual_model], placements)
+    >>> appended = pin.Model()
+    >>> for i, M in enumerate(placements):
+    ...     m = robot.model.copy()
+    ...     for f in m.frames:
+    ...         f.name = "%s_#%d" % (f.name, i)
+    ...     for j, n in enumerate(m.names):
+    ...         m.names[j] = "%s_#%d" % (n, i)
+    ...     appended = pin.appendModel(appended, m, 0, M)
+    >>> data, adata = full.createData(), appended.createData()
+    >>> q = pin.randomConfiguration(full)
+    >>> pin.framesForwardKinematics(full, data, q)
+    >>> pin.framesForwardKinematics(appended, adata, q)
+    >>> all(
+    ...     M.isApprox(adata.oMf[appended.getFrameId(f.name)])
+    ...     for M, f in zip(data.oMf, full.frames)
+    ... )
+    True
+    >>> g = vfull.geometryObjects[vfull.getGeometryId("wrist_3_link_0_#2")]
+    >>> full.names[g.parentJoint], full.frames[g.parentFrame].name
+    ('wrist_3_joint_#2', 'wrist_3_link_#2')
     """
-    Create a robot composed of 4 UR5
+    njoints, nframes = model.njoints - 1, model.nframes - 1
+    full = pin.Model()
+    full.name = model.name
+    for i, base in enumerate(placements):
+        # Tables from the joint and frame indexes of the model to those of copy #i.
+        jointIndex = np.arange(model.njoints) + i * njoints
+        jointIndex[0] = 0
+        frameIndex = np.arange(model.nframes) + i * nframes
+        frameIndex[0] = 0
+        for j in range(1, model.njoints):
+            parent = model.parents[j]
+            placement = model.jointPlacements[j]
+            full.addJoint(
+                int(jointIndex[parent]),
+                model.joints[j],
+                base * placement if parent == 0 else placement,
+                "%s_#%d" % (model.names[j], i),
+            )
+            full.appendBodyToJoint(
+                int(jointIndex[j]), model.inertias[j], pin.SE3.Identity()
+            )
+        for f in model.frames[1:]:
+            parentJoint = frameParentJoint(f)
+            full.addFrame(
+                pin.Frame(
+                    "%s_#%d" % (f.name, i),
+                    int(jointIndex[parentJoint]),
+                    int(frameIndex[frameParentFrame(f)]),
+                    base * f.placement if parentJoint == 0 else f.placement,
+                    f.type,
+                    f.inertia,
+                ),
+                False,
+            )
+    for name in JOINT_VECTORS:
+        if hasattr(model, name):
+            setattr(full, name, np.tile(getattr(model, name), len(placements)))
+
+    full_geom_models = []
+    for geom_model in geom_models:
+        full_geom = pin.GeometryModel()
+        for i, base in enumerate(placements):
+            copy = geom_model.copy()
+            for g in copy.geometryObjects:
+                g.name = "%s_#%d" % (g.name, i)
+                if g.parentJoint == 0:
+                    g.placement = base * g.placement
+                else:
+                    g.parentJoint += i * njoints
+                if g.parentFrame > 0:
+                    g.parentFrame += i * nframes
+                full_geom.addGeometryObject(g)
+        full_geom_models.append(full_geom)
+    return full, full_geom_models
+
+
+# (nbRobots, radius) -> Scene, see load_ur5_parallel.
+_scenes = {}
+
+
+def load_ur5_parallel(nbRobots=4, radius=0.3):
+    """
+    Create a robot composed of <nbRobots> UR5, placed at <radius> from the origin
+    and evenly spread around the Z axis (i.e. in the 4 directions x,y,-x,-y by
+    default). The models are only built once (see assemble), then each call returns
+    a copy.
 
     >>> ur5 = load('ur5')
     >>> ur5.nq
@@ -17,60 +138,27 @@ def load_ur5_parallel():
     24
     >>> len(robot.visual_model.geometryObjects)
     28
+    >>> robot.model is load_ur5_parallel().model
+    False
+    >>> load_ur5_parallel(16).nq
+    96
     """
-    robot = load("ur5")
-    nbRobots = 4
-
-    models = [robot.model.copy() for _ in range(nbRobots)]
-    vmodels = [robot.visual_model.copy() for _ in range(nbRobots)]
-
-    # Build the kinematic model by assembling 4 UR5
-    fullmodel = pin.Model()
-
-    for irobot, model in enumerate(models):
-        # Change frame names
-        for i, f in enumerate(model.frames):
-            f.name = "%s_#%d" % (f.name, irobot)
-        # Change joint names
-        for i, n in enumerate(model.names):
-            model.names[i] = "%s_#%d" % (n, irobot)
-
-        # Choose the placement of the new arm to be added
-        Mt = pin.SE3(
-            np.eye(3), np.array([0.3, 0, 0.0])
-        )  # First robot is simply translated
-        basePlacement = (
-            pin.SE3(pin.utils.rotate("z", np.pi * irobot / 2), np.zeros(3)) * Mt
+    key = (nbRobots, float(radius))
+    if key not in _scenes:
+        robot = load("ur5")
+        placements = [
+            pin.SE3(pin.utils.rotate("z", 2 * np.pi * irobot / nbRobots), np.zeros(3))
+            * pin.SE3(np.eye(3), np.array([radius, 0, 0.0]))
+            for irobot in range(nbRobots)
+        ]
+        model, [vmodel] = assemble(robot.model, [robot.visual_model], placements)
+        # fullrobot.q0 = np.array([-0.375, -1.2  ,  1.71 , -0.51 , -0.375,  0.   ]*4)
+        q0 = np.array(
+            [np.pi / 4, -np.pi / 4, -np.pi / 2, np.pi / 4, np.pi / 2, 0] * nbRobots
         )
-
-        # Append the kinematic model
-        fullmodel = pin.appendModel(fullmodel, model, 0, basePlacement)
-
-    # Build the geometry model
-    fullvmodel = pin.GeometryModel()
-
-    for irobot, (model, vmodel) in enumerate(zip(models, vmodels)):
-        # Change geometry names
-        for i, g in enumerate(vmodel.geometryObjects):
-            # Change the name to avoid conflict
-            g.name = "%s_#%d" % (g.name, irobot)
-
-            # Refere to new parent names in the full kinematic tree
-            g.parentFrame = fullmodel.getFrameId(model.frames[g.parentFrame].name)
-            g.parentJoint = fullmodel.getJointId(model.names[g.parentJoint])
-
-            # Append the geometry model
-            fullvmodel.addGeometryObject(g)
-            # print('add %s on frame %d "%s"',
-            # '% (g.name, g.parentFrame, fullmodel.frames[g.parentFrame].name)')
-
-    fullrobot = pin.RobotWrapper(fullmodel, fullvmodel, fullvmodel)
-    # fullrobot.q0 = np.array([-0.375, -1.2  ,  1.71 , -0.51 , -0.375,  0.   ]*4)
-    fullrobot.q0 = np.array(
-        [np.pi / 4, -np.pi / 4, -np.pi / 2, np.pi / 4, np.pi / 2, 0] * nbRobots
-    )
-
-    return fullrobot
+        # The visual model is also used as collision model.
+        _scenes[key] = Scene(model, vmodel, vmodel, q0)
+    return _scenes[key].robot()
 
 
 if __name__ == "__main__":
@@ -10,6 +10,8 @@ import example_robot_data as robex
 import numpy as np
 import pinocchio as pin
 
+from .scene import Scene
+
 
 def XYZRPYtoSE3(xyzrpy):
     rotate = pin.utils.rotate
@@ -18,7 +20,58 @@ def XYZRPYtoSE3(xyzrpy):
     return pin.SE3(R, p)
 
 
-def load_ur5_with_obstacles(robotname="ur5", reduced=False):
+# Capsule obstacles are placed by default at these XYZ-RPY parameters.
+OBSTACLES = [
+    [0.40, 0.0, 0.30, np.pi / 2, 0, 0],
+    [-0.08, -0.0, 0.69, np.pi / 2, 0, 0],
+    [0.23, -0.0, 0.04, np.pi / 2, 0, 0],
+    [-0.32, 0.0, -0.08, np.pi / 2, 0, 0],
+]
+
+
+# (robotname, reduced, obstacles) -> Scene, see ur5_with_obstacles_scene.
+_scenes = {}
+
+
+def ur5_with_obstacles_scene(robotname="ur5", reduced=False, obstacles=None):
+    """
+    Return the Scene of load_ur5_with_obstacles, only built on the first call with
+    the same arguments.
+
+    >>> scene = ur5_with_obstacles_scene(reduced=True)
+    >>> scene is ur5_with_obstacles_scene(reduced=True)
+    True
+    >>> import pickle
+    >>> robot = pickle.loads(pickle.dumps(scene)).robot()
+    >>> robot.nq, robot.collision_model.ngeoms, robot.visual_model.ngeoms
+    (2, 12, 0)
+    >>> len(robot.collision_model.collisionPairs)
+    32
+    """
+    obstacles = OBSTACLES if obstacles is None else obstacles
+    key = (robotname, reduced, tuple(tuple(float(x) for x in o) for o in obstacles))
+    if key not in _scenes:
+        robot = _build_ur5_with_obstacles(robotname, reduced, obstacles)
+        _scenes[key] = Scene(
+            robot.model, robot.collision_model, robot.visual_model, robot.q0
+        )
+    return _scenes[key]
+
+
+def load_ur5_with_obstacles(robotname="ur5", reduced=False, obstacles=None):
+    """
+    Load the robot with the capsule obstacles placed at the XYZ-RPY <obstacles>
+    (default to OBSTACLES). The models are only built once (see
+    ur5_with_obstacles_scene), then each call returns a copy.
+
+    >>> robot = load_ur5_with_obstacles(reduced=True)
+    >>> robot.model is load_ur5_with_obstacles(reduced=True).model
+    False
+    """
+    return ur5_with_obstacles_scene(robotname, reduced, obstacles).robot()
+
+
+def _build_ur5_with_obstacles(robotname, reduced, oMobs):
     ### Robot
     # Load the robot
     robot = robex.load(robotname)
@@ -42,14 +95,6 @@ def load_ur5_with_obstacles(robotname="ur5", reduced=False):
         robot.q0 = robot.q0[unlocks].copy()
 
     ### Obstacle map
-    # Capsule obstacles will be placed at these XYZ-RPY parameters
-    oMobs = [
-        [0.40, 0.0, 0.30, np.pi / 2, 0, 0],
-        [-0.08, -0.0, 0.69, np.pi / 2, 0, 0],
-        [0.23, -0.0, 0.04, np.pi / 2, 0, 0],
-        [-0.32, 0.0, -0.08, np.pi / 2, 0, 0],
-    ]
-
     # Load visual objects and add them in collision/visual models
     rad, length = 0.1, 0.4  # radius and length of capsules
     for i, xyzrpy in enumerate(oMobs):
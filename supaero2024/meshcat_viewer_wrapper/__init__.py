@@ -1 +1,11 @@
-from .visualizer import MeshcatVisualizer  # noqa
+__all__ = ["MeshcatVisualizer"]
+
+
+def __getattr__(name):
+    # Import meshcat and pinocchio.visualize only when the viewer is needed, so that
+    # importing e.g. colors or transformations stays cheap.
+    if name == "MeshcatVisualizer":
+        from .visualizer import MeshcatVisualizer
+
+        return MeshcatVisualizer
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,6 +1,3 @@
-import meshcat
-
-
 def rgb2int(r, g, b):
     """
     Convert 3 integers (chars) 0 <= r, g, b < 256 into one
@@ -21,30 +18,39 @@ def rgb2int(r, g, b):
 
 
 def material(color, transparent=False):
+    import meshcat
+
     mat = meshcat.geometry.MeshPhongMaterial()
     mat.color = color
     mat.transparent = transparent
     return mat
 
 
-red = material(color=rgb2int(255, 0, 0), transparent=False)
-blue = material(color=rgb2int(0, 0, 255), transparent=False)
-green = material(color=rgb2int(0, 255, 0), transparent=False)
-yellow = material(color=rgb2int(255, 255, 0), transparent=False)
-magenta = material(color=rgb2int(255, 0, 255), transparent=False)
-cyan = material(color=rgb2int(0, 255, 255), transparent=False)
-white = material(color=rgb2int(250, 250, 250), transparent=False)
-black = material(color=rgb2int(5, 5, 5), transparent=False)
-grey = material(color=rgb2int(120, 120, 120), transparent=False)
-
-colormap = {
-    "red": red,
-    "blue": blue,
-    "green": green,
-    "yellow": yellow,
-    "magenta": magenta,
-    "cyan": cyan,
-    "black": black,
-    "white": white,
-    "grey": grey,
+RGB = {
+    "red": (255, 0, 0),
+    "blue": (0, 0, 255),
+    "green": (0, 255, 0),
+    "yellow": (255, 255, 0),
+    "magenta": (255, 0, 255),
+    "cyan": (0, 255, 255),
+    "black": (5, 5, 5),
+    "white": (250, 250, 250),
+    "grey": (120, 120, 120),
 }
+
+
+def __getattr__(name):
+    """
+    The materials red, blue, ..., and the colormap dict gathering them, are only
+    created (hence meshcat is only imported) when first accessed.
+    """
+    if name == "colormap":
+        colormap = {
+            key: material(color=rgb2int(*rgb), transparent=False)
+            for key, rgb in RGB.items()
+        }
+        globals().update(colormap, colormap=colormap)
+        return colormap
+    if name in RGB:
+        return __getattr__("colormap")[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,112 @@
+"""
+Instanced rendering: the geometry objects sharing the same hppfcl shape (same type,
+dimensions and transparency) are drawn by a single three.js InstancedMesh, holding
+the per-instance placements and colors.
+meshcat has no command to update the instance matrices alone: when an instance
+moves, the whole InstancedMesh (geometry buffers and material included) is sent
+again, and rebuilt by the browser. This is much heavier than the transforms of the
+individual objects, so only the static objects (attached to the universe) are
+instanced by default.
+"""
+
+import hashlib
+
+import hppfcl
+import meshcat.geometry as mg
+import numpy as np
+
+
+class InstancedMesh(mg.Mesh):
+    """
+    The same geometry and material drawn at several places, given by the (N,4,4)
+    array <placements>, with the (N,3) RGB <colors> of each instance.
+    """
+
+    _type = "InstancedMesh"
+
+    def __init__(self, geometry, material, placements, colors=None):
+        super().__init__(geometry, material)
+        self.placements = np.asarray(placements)
+        self.colors = colors
+
+    def lower(self):
+        data = super().lower()
+        # The intrinsic transform of the geometry (e.g. for cylinders) is applied
+        # to each instance, hence the object itself is not transformed.
+        T = self.placements @ self.geometry.intrinsic_transform()
+        data["object"]["matrix"] = list(np.eye(4).flatten())
+        data["object"]["count"] = len(T)
+        # One column-major 4x4 matrix per instance.
+        data["object"]["instanceMatrix"] = mg.pack_numpy_array(
+            T.transpose(0, 2, 1).reshape(-1, 16).T
+        )
+        if self.colors is not None:
+            data["object"]["instanceColor"] = mg.pack_numpy_array(
+                np.asarray(self.colors, dtype=np.float32).T
+            )
+        return data
+
+
+def convexPoints(geom):
+    """Return the (N,3) array of the vertices of a hppfcl.ConvexBase."""
+    try:
+        return np.asarray(geom.points())
+    except TypeError:  # hppfcl 2: the points are accessed one by one
+        return np.array([geom.points(i) for i in range(geom.num_points)])
+
+
+def convexPolygons(geom):
+    """Return the (M,3) array of the vertex indexes of the triangles of a convex."""
+    faces = [geom.polygons(k) for k in range(geom.num_polygons)]
+    return np.array([[f[i] for i in range(3)] for f in faces], dtype=np.int64)
+
+
+def convexKey(geom):
+    """Return a hash of the content of a hppfcl.ConvexBase (vertices and faces)."""
+    points = np.ascontiguousarray(convexPoints(geom), dtype=float)
+    faces = np.ascontiguousarray(convexPolygons(geom))
+    return hashlib.sha1(points.tobytes() + faces.tobytes()).hexdigest()
+
+
+def shapeKey(geometry_object):
+    """
+    Return a hashable key describing the shape of a pin.GeometryObject, such that two
+    objects with the same key can be drawn by the same meshcat geometry and
+    material (up to the color). Return None for the shapes which cannot be
+    instanced.
+    """
+    geom = geometry_object.geometry
+    if isinstance(geom, hppfcl.Sphere):
+        dims = (geom.radius,)
+    elif isinstance(geom, hppfcl.Box):
+        dims = tuple(geom.halfSide)
+    elif isinstance(geom, (hppfcl.Capsule, hppfcl.Cylinder, hppfcl.Cone)):
+        dims = (geom.radius, geom.halfLength)
+    elif isinstance(geom, hppfcl.Ellipsoid):
+        dims = tuple(geom.radii)
+    elif isinstance(geom, hppfcl.ConvexBase):
+        dims = (convexKey(geom),)
+    else:
+        return None
+    return (
+        type(geom).__name__,
+        dims,
+        tuple(geometry_object.meshScale),
+        float(geometry_object.meshColor[3]),
+    )
+
+
+def findInstances(geom_model, minimum=2, movable=False):
+    """
+    Group the geometry objects of <geom_model> by shape. Return the list of the groups
+    (lists of geometry ids) containing at least <minimum> objects. Unless <movable>
+    is True, only the static objects (parentJoint 0) are grouped.
+    """
+    groups = {}
+    for ig, g in enumerate(geom_model.geometryObjects):
+        if not movable and g.parentJoint != 0:
+            continue
+        key = shapeKey(g)
+        if key is not None:
+            groups.setdefault(key, []).append(ig)
+    return [ids for ids in groups.values() if len(ids) >= minimum]
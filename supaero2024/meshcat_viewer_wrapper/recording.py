@@ -0,0 +1,161 @@
+"""
+Offline recording of the node transforms sent to the viewer. A recording can be
+turned into a meshcat animation, or saved to (and loaded from) a compact .npz file
+containing the 3x4 transforms of each node as float32.
+A whole trajectory can also be sent at once as a PackedAnimation, whose key frames
+are stored in binary float32 buffers.
+"""
+
+import meshcat.geometry as mg
+import numpy as np
+import umsgpack
+from meshcat.animation import Animation, AnimationFrameVisualizer
+from meshcat.path import Path
+
+from .transformations import homogeneous2xyzquat
+
+
+class Recording:
+    """
+    Store, frame by frame, the transforms of the viewer nodes, typically through
+    MeshcatVisualizer.recording(). Nodes are identified by their meshcat path, e.g.
+    "/meshcat/pinocchio/visuals/base_link_0". The transform of a node is set with
+    setTransform(path, T), and nextFrame() closes the current frame.
+
+    >>> rec = Recording(fps=10)
+    >>> rec.setTransform("/meshcat/ball", np.eye(4))
+    >>> rec.nextFrame()
+    >>> rec.setTransform("/meshcat/ball", np.diag([1.0, 1.0, 1.0, 1.0]))
+    >>> frames, T = rec.transforms("/meshcat/ball")
+    >>> frames.tolist(), T.shape
+    ([0, 1], (2, 4, 4))
+
+    The scale of the meshes does not change the animated rotation:
+    >>> rec.setTransform("/meshcat/mesh", np.diag([2.0, 3.0, 4.0, 1.0]))
+    >>> clip = rec.toAnimation().clips[Path(("meshcat", "mesh"))]
+    >>> np.allclose(clip.tracks["quaternion"].values, [[0, 0, 0, 1]])
+    True
+    """
+
+    def __init__(self, fps=30):
+        self.fps = fps
+        self.frame = 0
+        self.tracks = {}  # path -> [ list of frame indexes, list of 3x4 matrices ]
+
+    def setTransform(self, path, matrix):
+        frames, matrices = self.tracks.setdefault(path, ([], []))
+        matrix = np.array(matrix[:3], dtype=np.float32)
+        if frames and frames[-1] == self.frame:
+            # Only the last transform of a node within a frame is kept.
+            matrices[-1] = matrix
+        else:
+            frames.append(self.frame)
+            matrices.append(matrix)
+
+    def nextFrame(self):
+        self.frame += 1
+
+    def transforms(self, path):
+        """Return the frame indexes and the (n,4,4) transforms recorded for <path>."""
+        frames, matrices = self.tracks[path]
+        T = np.zeros([len(frames), 4, 4])
+        T[:, :3] = matrices
+        T[:, 3, 3] = 1
+        return np.array(frames), T
+
+    def toAnimation(self):
+        """Convert the recording into a meshcat.animation.Animation."""
+        anim = Animation(default_framerate=self.fps)
+        for path in self.tracks:
+            node = Path(tuple(path.strip("/").split("/")))
+            frames, T = self.transforms(path)
+            # The transforms of the meshes contain their scale (meshScale), which
+            # is not animated: only the rotation is converted to a quaternion.
+            T[:, :3, :3] /= np.linalg.norm(T[:, :3, :3], axis=1, keepdims=True)
+            for frame, p in zip(frames, homogeneous2xyzquat(T)):
+                key = AnimationFrameVisualizer(anim, node, int(frame))
+                key.set_property("position", "vector3", p[:3].tolist())
+                key.set_property("quaternion", "quaternion", p[3:].tolist())
+        return anim
+
+    def save(self, filename):
+        """Save the recording as a .npz file."""
+        arrays = {}
+        for i, (frames, matrices) in enumerate(self.tracks.values()):
+            arrays["frames_%d" % i] = np.array(frames, dtype=np.int32)
+            arrays["transforms_%d" % i] = np.array(matrices, dtype=np.float32)
+        np.savez_compressed(
+            filename,
+            fps=self.fps,
+            nframes=self.frame,
+            paths=np.array(list(self.tracks), dtype=str),
+            **arrays,
+        )
+
+    @classmethod
+    def load(cls, filename):
+        """Load a recording saved by Recording.save()."""
+        with np.load(filename) as npz:
+            rec = cls(fps=int(npz["fps"]))
+            rec.frame = int(npz["nframes"])
+            for i, path in enumerate(npz["paths"]):
+                rec.tracks[str(path)] = (
+                    list(npz["frames_%d" % i]),
+                    list(npz["transforms_%d" % i]),
+                )
+        return rec
+
+
+class PackedAnimation:
+    """
+    Animation of the nodes <paths> (meshcat paths, as in Recording), from the
+    (T,n,7) array of their XYZ-quaternion <placements> at each of the T frames.
+    It can be sent through meshcat.commands.SetAnimation like a
+    meshcat.animation.Animation, but the key frames of each track are packed in two
+    float32 buffers (times and values) instead of one msgpack map per key.
+    The browser then interpolates between the key frames.
+
+    >>> anim = PackedAnimation(["/meshcat/ball"], np.zeros([3, 1, 7]), fps=10)
+    >>> track = anim.lower()[0]["clip"]["tracks"][1]
+    >>> track["name"], track["type"], len(track["values"].data)
+    ('.quaternion', 'quaternion', 48)
+    """
+
+    def __init__(self, paths, placements, fps=30):
+        self.paths = list(paths)
+        self.placements = np.asarray(placements, dtype=np.float32)
+        self.fps = fps
+
+    def lower(self):
+        # Times are given in frames, and scaled by 1/fps by three.js.
+        times = _packFloat32(np.arange(len(self.placements)))
+        return [
+            {
+                "path": path,
+                "clip": {
+                    "fps": self.fps,
+                    "name": "default",
+                    "tracks": [
+                        {
+                            "name": ".position",
+                            "type": "vector3",
+                            "times": times,
+                            "values": _packFloat32(self.placements[:, i, :3]),
+                        },
+                        {
+                            "name": ".quaternion",
+                            "type": "quaternion",
+                            "times": times,
+                            "values": _packFloat32(self.placements[:, i, 3:]),
+                        },
+                    ],
+                },
+            }
+            for i, path in enumerate(self.paths)
+        ]
+
+
+def _packFloat32(array):
+    """Pack an array as a flat float32 buffer, received as a Float32Array by meshcat."""
+    array = np.ascontiguousarray(array, dtype=np.float32)
+    return umsgpack.Ext(mg.threejs_type(array.dtype)[1], array.tobytes())
@@ -0,0 +1,93 @@
+"""
+Instrumentation of the viewer: number of calls, bytes sent and latency histogram for
+each kind of call, either a method of the wrapper (display, applyConfiguration) or a
+meshcat command sent to the server (set_object, set_transform, delete, ...).
+"""
+
+import contextlib
+import time
+
+import numpy as np
+
+# Bounds of the latency histogram bins (in seconds), 4 bins per decade from 1us.
+BINS = 10 ** np.arange(-6, 1.01, 0.25)
+
+
+class Stats:
+    """
+    Statistics of the viewer calls, see MeshcatVisualizer(instrument=True) and
+    MeshcatVisualizer.stats().
+
+    >>> stats = Stats()
+    >>> stats.add("set_object", 2e-3, nbytes=1000)
+    >>> stats.add("set_object", 4e-3, nbytes=500)
+    >>> s = stats.summary()["set_object"]
+    >>> s["calls"], s["bytes"], round(s["mean"], 6)
+    (2, 1500, 0.003)
+    >>> int(s["histogram"].sum())
+    2
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # kind -> [ number of calls, bytes, total time, max time, histogram ]
+        self.kinds = {}
+
+    def add(self, kind, duration, nbytes=0):
+        """Count one call of <kind> lasting <duration> seconds and sending <nbytes>."""
+        if kind not in self.kinds:
+            self.kinds[kind] = [0, 0, 0.0, 0.0, np.zeros(len(BINS) + 1, dtype=int)]
+        counters = self.kinds[kind]
+        counters[0] += 1
+        counters[1] += nbytes
+        counters[2] += duration
+        counters[3] = max(counters[3], duration)
+        counters[4][np.searchsorted(BINS, duration)] += 1
+
+    @contextlib.contextmanager
+    def timed(self, kind):
+        """Count one call of <kind>, lasting the time spent in the context."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(kind, time.perf_counter() - start)
+
+    def summary(self):
+        """
+        Return a dict kind -> dict with the number of calls, the bytes sent, the
+        total, mean and max latencies (in seconds) and the latency histogram, whose
+        bin i counts the calls lasting less than BINS[i] (and more than BINS[i-1]).
+        """
+        return {
+            kind: {
+                "calls": calls,
+                "bytes": nbytes,
+                "total": total,
+                "mean": total / calls,
+                "max": maxtime,
+                "histogram": histogram.copy(),
+            }
+            for kind, (calls, nbytes, total, maxtime, histogram) in self.kinds.items()
+        }
+
+    def __str__(self):
+        lines = [
+            "%-20s %8s %12s %10s %10s %10s"
+            % ("kind", "calls", "bytes", "total(s)", "mean(ms)", "max(ms)")
+        ]
+        for kind, s in sorted(self.summary().items()):
+            lines.append(
+                "%-20s %8d %12d %10.3f %10.3f %10.3f"
+                % (
+                    kind,
+                    s["calls"],
+                    s["bytes"],
+                    s["total"],
+                    s["mean"] * 1e3,
+                    s["max"] * 1e3,
+                )
+            )
+        return "\n".join(lines)
@@ -1,8 +1,11 @@
 import doctest
 
-from supaero2024.meshcat_viewer_wrapper import colors
+from supaero2024.meshcat_viewer_wrapper import colors, recording, stats, transformations
 
 
 def load_tests(loader, tests, pattern):
     tests.addTests(doctest.DocTestSuite(colors))
+    tests.addTests(doctest.DocTestSuite(recording))
+    tests.addTests(doctest.DocTestSuite(stats))
+    tests.addTests(doctest.DocTestSuite(transformations))
     return tests
@@ -14,3 +14,75 @@ def planar(x, y, theta):
 def translation2d(x, y):
     """Convert a 2d vector (x,y) into a 3d transformation translating the Y,Z plane."""
     return [0, x, y, 1, 0, 0, 0]
+
+
+def xyzquat2homogeneous(placements):
+    """
+    Convert a (N,7) array of XYZ-quaternion placements (quaternion stored as x,y,z,w,
+    as in Pinocchio) into the (N,4,4) array of the corresponding homogeneous matrices.
+
+    >>> T = xyzquat2homogeneous([[1, 2, 3, 0, 0, 0, 1], [0, 0, 0, 0, 0, 1, 0]])
+    >>> T.shape
+    (2, 4, 4)
+    >>> T[0].tolist()
+    [[1.0, 0.0, 0.0, 1.0], [0.0, 1.0, 0.0, 2.0], [0.0, 0.0, 1.0, 3.0], [0.0, 0.0, 0.0, 1.0]]
+    >>> T[1, :3, :3].diagonal().tolist()  # Rotation of pi around Z
+    [-1.0, -1.0, 1.0]
+    """
+    placements = np.asarray(placements, dtype=float)
+    quat = placements[:, 3:] / np.linalg.norm(placements[:, 3:], axis=1)[:, None]
+    x, y, z, w = quat.T
+    T = np.zeros([len(placements), 4, 4])
+    T[:, 0, 0] = 1 - 2 * (y * y + z * z)
+    T[:, 0, 1] = 2 * (x * y - z * w)
+    T[:, 0, 2] = 2 * (x * z + y * w)
+    T[:, 1, 0] = 2 * (x * y + z * w)
+    T[:, 1, 1] = 1 - 2 * (x * x + z * z)
+    T[:, 1, 2] = 2 * (y * z - x * w)
+    T[:, 2, 0] = 2 * (x * z - y * w)
+    T[:, 2, 1] = 2 * (y * z + x * w)
+    T[:, 2, 2] = 1 - 2 * (x * x + y * y)
+    T[:, :3, 3] = placements[:, :3]
+    T[:, 3, 3] = 1
+    return T
+
+
+def homogeneous2xyzquat(T):
+    """
+    Convert a (N,4,4) array of homogeneous matrices into the (N,7) array of the
+    corresponding XYZ-quaternion placements (quaternion stored as x,y,z,w). This is
+    the inverse of xyzquat2homogeneous.
+
+    >>> p = [[1, 2, 3, 0, 0, 0, 1], [0, 0, 0, 0, 0, 1, 0], [0, 0, 0, 0.5, 0.5, 0.5, 0.5]]
+    >>> np.allclose(homogeneous2xyzquat(xyzquat2homogeneous(p)), p)
+    True
+    """
+    T = np.asarray(T, dtype=float)
+    R = T[:, :3, :3]
+    r00, r11, r22 = R[:, 0, 0], R[:, 1, 1], R[:, 2, 2]
+    # The 4 candidate formulas are computed at once, and for each matrix the one
+    # dividing by the largest quaternion coefficient is kept (Shepperd's method).
+    diag = np.stack(
+        [r00 + r11 + r22, r00 - r11 - r22, -r00 + r11 - r22, -r00 - r11 + r22], 1
+    )
+    big = np.sqrt(np.maximum(1 + diag, 1e-12)) / 2  # |w|, |x|, |y|, |z|
+    a = R[:, 2, 1] - R[:, 1, 2]
+    b = R[:, 0, 2] - R[:, 2, 0]
+    c = R[:, 1, 0] - R[:, 0, 1]
+    d = R[:, 0, 1] + R[:, 1, 0]
+    e = R[:, 0, 2] + R[:, 2, 0]
+    f = R[:, 1, 2] + R[:, 2, 1]
+    w, x, y, z = big.T
+    candidates = np.stack(  # [ candidate, coefficient x y z w, matrix ]
+        [
+            [a / (4 * w), b / (4 * w), c / (4 * w), w],
+            [x, d / (4 * x), e / (4 * x), a / (4 * x)],
+            [d / (4 * y), y, f / (4 * y), b / (4 * y)],
+            [e / (4 * z), f / (4 * z), z, c / (4 * z)],
+        ]
+    )
+    best = np.argmax(diag, axis=1)
+    placements = np.zeros([len(T), 7])
+    placements[:, :3] = T[:, :3, 3]
+    placements[:, 3:] = candidates[best, :, np.arange(len(T))]
+    return placements
@@ -1,64 +1,407 @@
+import contextlib
+import copy
+import functools
+import os
 import random
+import threading
+import uuid
+import warnings
+from typing import Any, Dict, Union
 
+import hppfcl
 import meshcat
+import meshcat.geometry as mg
 import numpy as np
 import pinocchio as pin
 from pinocchio.visualize import MeshcatVisualizer as PMV
 
-from . import colors
+from . import colors, transformations
+from .instancing import InstancedMesh, convexKey, findInstances
+from .recording import PackedAnimation, Recording
+from .stats import Stats
+from .window import BufferedWindow
+
+
+@functools.lru_cache(maxsize=256)
+def _materialFromRGBA(rgba):
+    material = meshcat.geometry.MeshPhongMaterial()
+    material.color = colors.rgb2int(*[int(c * 255) for c in rgba[:3]])
+    if len(rgba) == 3:
+        material.transparent = False
+    else:
+        material.transparent = rgba[3] < 1
+        material.opacity = float(rgba[3])
+    return material
+
+
+@functools.lru_cache(maxsize=256)
+def _geometry(geometryType, *dims):
+    """
+    Return a meshcat geometry of type <geometryType> (e.g. meshcat.geometry.Sphere)
+    with dimensions <dims>. The same object (hence the same uuid) is returned for the
+    same arguments.
+    """
+    return geometryType(*dims)
 
 
 def materialFromColor(color):
+    """
+    Return a meshcat material from a color name, a RGB(A) list or a material.
+    The materials are shared: the same object is returned for the same color.
+    """
     if isinstance(color, meshcat.geometry.MeshPhongMaterial):
         return color
     elif isinstance(color, str):
         material = colors.colormap[color]
     elif isinstance(color, list):
-        material = meshcat.geometry.MeshPhongMaterial()
-        material.color = colors.rgb2int(*[int(c * 255) for c in color[:3]])
-        if len(color) == 3:
-            material.transparent = False
-        else:
-            material.transparent = color[3] < 1
-            material.opacity = float(color[3])
+        material = _materialFromRGBA(tuple(float(c) for c in color))
     elif color is None:
-        material = random.sample(list(colors.colormap), 1)[0]
+        material = colors.colormap[random.choice(list(colors.colormap))]
     else:
         material = colors.black
     return material
 
 
+def _instrumented(method):
+    """Count and time the calls to <method> when the viewer is instrumented."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        stats = self.viewer.window.stats
+        if stats is None:
+            return method(self, *args, **kwargs)
+        with stats.timed(method.__name__):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
 class MeshcatVisualizer(PMV):
     def __init__(
-    self, robot=None, model=None, collision_model=None, visual_model=None, url=None
+        self,
+        robot=None,
+        model=None,
+        collision_model=None,
+        visual_model=None,
+        url=None,
+        transform_tolerance=1e-6,
+        headless=None,
+        instancing=False,
+        instrument=False,
     ):
+        """
+        Create the viewer, possibly connected to an existing server at <url>.
+        A node transform is only sent to the server when it differs from the
+        previously sent one by more than <transform_tolerance> (set it to None to
+        always send the transforms).
+        If <headless> is True (default to the environment variable SUPAERO_HEADLESS),
+        no server is started and all the viewer calls do nothing, e.g. for CI or
+        benchmarks.
+        If <instancing> is True, the static geometry objects (attached to the
+        universe) sharing the same hppfcl shape are uploaded once as an instanced
+        mesh (see instancing.py). This pays off for large static scenes only: an
+        instanced mesh is sent again as a whole whenever one of its instances moves,
+        so the moving objects are never instanced.
+        If <instrument> is True, the calls to the viewer are counted and timed, see
+        stats().
+        """
+        if headless is None:
+            headless = os.environ.get("SUPAERO_HEADLESS", "0").lower() in [
+                "1",
+                "true",
+                "yes",
+            ]
+        self.headless = headless
+        self.instancing = instancing
+        # Update the pin2 version of loadPrimitive by the pin3 version
+        pin.visualize.meshcat_visualizer.loadPrimitive = _loadPrimitive
+        self.instances = {}  # geometry type -> list of instanced groups
+        self.instancedIds = {}  # geometry type -> set of the instanced geometry ids
+        self._displayThread = None
+        self._pendingLock = threading.Lock()
+
         if robot is not None:
             super().__init__(robot.model, robot.collision_model, robot.visual_model)
         elif model is not None:
             super().__init__(model, collision_model, visual_model)
 
+        if headless:
+            server = meshcat.Visualizer(window=BufferedWindow(None))
+        else:
+            server = self._connect(url)
+            # All the commands sent to meshcat go through this window, see batch().
+            server.window = BufferedWindow(server.window, transform_tolerance)
+        if instrument:
+            server.window.stats = Stats()
+
+        if robot is not None or model is not None:
+            self.initViewer(loadModel=True, viewer=server)
+        else:
+            self.viewer = server
+
+    def _connect(self, url):
         if url is not None:
             if url == "classical":
                 url = "tcp://127.0.0.1:6000"
                 print(f'*** You asked to start meshcat "classically" in {url}')
                 print('*** Did you start meshcat manually (meshcat-server)')
             print("Wrapper tries to connect to server <%s>" % url)
-            server = meshcat.Visualizer(zmq_url=url)
-        else:
-            server = None
+        return meshcat.Visualizer(zmq_url=url)
 
-        if robot is not None or model is not None:
-            self.initViewer(loadModel=True, viewer=server)
-        else:
-            self.viewer = server if server is not None else meshcat.Visualizer()
+    def _geometryModel(self, geometry_type):
+        if geometry_type == pin.GeometryType.VISUAL:
+            return self.visual_model, self.visual_data
+        return self.collision_model, self.collision_data
+
+    def loadViewerModel(self, *args, **kwargs):
+        self.instances, self.instancedIds = {}, {}
+        if self.instancing:
+            for geometry_type in [pin.GeometryType.COLLISION, pin.GeometryType.VISUAL]:
+                geom_model, _ = self._geometryModel(geometry_type)
+                if geom_model is not None:
+                    groups = findInstances(geom_model)
+                    self.instances[geometry_type] = [{"ids": ids} for ids in groups]
+                    self.instancedIds[geometry_type] = set(sum(groups, []))
+
+        super().loadViewerModel(*args, **kwargs)
+
+        for geometry_type, groups in self.instances.items():
+            geom_model, geom_data = self._geometryModel(geometry_type)
+            for k, group in enumerate(groups):
+                g = geom_model.geometryObjects[group["ids"][0]]
+                root = self.getViewerNodeName(g, geometry_type)[: -len(g.name)]
+                alpha = float(g.meshColor[3])
+                group["name"] = root + "instances/%d" % k
+                group["geometry"] = _loadPrimitive(g)
+                group["material"] = _materialFromRGBA((1.0, 1.0, 1.0, alpha))
+                group["placements"] = None
+                # The individual nodes of the instanced objects are not loaded, do not
+                # send their placements either.
+                for i in group["ids"]:
+                    name = self.getViewerNodeName(
+                        geom_model.geometryObjects[i], geometry_type
+                    )
+                    self.viewer.window.ignored.add(self.viewer[name].path.lower())
+            pin.updateGeometryPlacements(self.model, self.data, geom_model, geom_data)
+            self._updateInstances(geometry_type)
+
+    def loadPrimitive(self, geometry_object):
+        # Only called by pinocchio >= 2.99 (pinocchio 2 uses _loadPrimitive below).
+        if isinstance(geometry_object.geometry, hppfcl.ConvexBase):
+            return _loadConvex(geometry_object.geometry)
+        return super().loadPrimitive(geometry_object)
+
+    def loadViewerGeometryObject(self, geometry_object, geometry_type, *args, **kwargs):
+        geom_model, _ = self._geometryModel(geometry_type)
+        instanced = self.instancedIds.get(geometry_type, ())
+        if geom_model.getGeometryId(geometry_object.name) in instanced:
+            return
+        super().loadViewerGeometryObject(
+            geometry_object, geometry_type, *args, **kwargs
+        )
+
+    def updatePlacements(self, geometry_type):
+        super().updatePlacements(geometry_type)
+        self._updateInstances(geometry_type)
+
+    def _updateInstances(self, geometry_type):
+        """
+        Send again the whole instanced meshes (geometry and material included)
+        whose placements changed since last time.
+        """
+        geom_model, geom_data = self._geometryModel(geometry_type)
+        for group in self.instances.get(geometry_type, []):
+            if "name" not in group:  # Still loading the model
+                continue
+            ids = group["ids"]
+            T = np.array([geom_data.oMg[i].homogeneous for i in ids])
+            T[:, :3, :3] *= geom_model.geometryObjects[ids[0]].meshScale
+            previous, tolerance = group["placements"], self.viewer.window.tolerance
+            if (
+                previous is not None
+                and tolerance is not None
+                and np.max(np.abs(previous - T)) <= tolerance
+            ):
+                continue
+            group["placements"] = T
+            rgb = [geom_model.geometryObjects[i].meshColor[:3] for i in ids]
+            self.viewer[group["name"]].set_object(
+                InstancedMesh(group["geometry"], group["material"], T, rgb)
+            )
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Collect all the commands (objects and transforms) sent to the viewer in the
+        context and send them at once when leaving it. Successive transforms of the
+        same node are merged. Typical use is once per frame:
+            with viz.batch():
+                viz.display(q)
+                viz.applyConfiguration("world/ball", M)
+        """
+        self.viewer.window.begin()
+        try:
+            yield self
+        finally:
+            self.viewer.window.end()
+
+    @contextlib.contextmanager
+    def recording(self, fps=30):
+        """
+        Record the node transforms in the context into a Recording, instead of sending
+        them to the server. Each call to display() closes one frame, and play() does
+        not sleep. The recording can then be saved, or sent back as an animation:
+            with viz.recording(fps=50) as rec:
+                viz.play(xs, dt)
+            rec.save("traj.npz")
+            viz.setAnimation(rec)
+        """
+        rec = Recording(fps)
+        self.viewer.window.recording = rec
+        try:
+            yield rec
+        finally:
+            self.viewer.window.recording = None
+
+    @property
+    def recorder(self):
+        """The Recording in progress, if any (None otherwise)."""
+        return self.viewer.window.recording
+
+    def setAnimation(self, recording, play=True, repetitions=1):
+        """Send a Recording to the viewer as a meshcat animation."""
+        self.viewer.set_animation(recording.toAnimation(), play, repetitions)
+
+    def uploadTrajectory(self, q_trajectory, dt=1 / 30, play=True, repetitions=1):
+        """
+        Send the whole trajectory <q_trajectory> ((T,nq) array, one configuration
+        every <dt> seconds) to the viewer in a single message, as an animation which
+        is then played and interpolated by the browser. Compared to play(), the
+        placements of all the nodes are computed beforehand, and only the moving
+        nodes are sent, as packed float32 buffers. The static nodes (and the
+        instanced shapes, which are not animated) are first displayed at the initial
+        configuration, in one batch.
+        """
+        if self.headless:
+            return
+        q_trajectory = np.asarray(q_trajectory)
+        with self.batch():
+            self.display(q_trajectory[0])
+        types = [
+            geometry_type
+            for geometry_type, displayed in [
+                (pin.GeometryType.VISUAL, self.display_visuals),
+                (pin.GeometryType.COLLISION, self.display_collisions),
+            ]
+            if displayed
+        ]
+        T = {
+            geometry_type: np.zeros(
+                [len(q_trajectory), self._geometryModel(geometry_type)[0].ngeoms, 4, 4]
+            )
+            for geometry_type in types
+        }
+        for k, q in enumerate(q_trajectory):
+            pin.forwardKinematics(self.model, self.data, q)
+            for geometry_type in types:
+                geom_model, geom_data = self._geometryModel(geometry_type)
+                pin.updateGeometryPlacements(
+                    self.model, self.data, geom_model, geom_data
+                )
+                T[geometry_type][k] = [M.homogeneous for M in geom_data.oMg]
+
+        paths, placements = [], []
+        for geometry_type in types:
+            geom_model = self._geometryModel(geometry_type)[0]
+            instanced = self.instancedIds.get(geometry_type, set())
+            for ig, g in enumerate(geom_model.geometryObjects):
+                Tg = T[geometry_type][:, ig]
+                if ig in instanced or np.ptp(Tg, axis=0).max() <= 1e-9:
+                    continue
+                if isinstance(g.geometry, (hppfcl.Plane, hppfcl.Halfspace)):
+                    Tg[:, :3, 3] += Tg[:, :3, :3] @ (g.geometry.d * g.geometry.n)
+                name = self.getViewerNodeName(g, geometry_type)
+                paths.append(self.viewer[name].path.lower())
+                placements.append(transformations.homogeneous2xyzquat(Tg))
+        if not paths:
+            return
+        animation = PackedAnimation(paths, np.stack(placements, 1), fps=1 / dt)
+        self.viewer.set_animation(animation, play, repetitions)
+
+    def startAsyncDisplay(self, rate=30):
+        """
+        From now on, display(q) only stores q, and a background thread displays the
+        last stored configuration <rate> times per second. This decouples the
+        simulation loop from the rendering, which then needs no sleep:
+            viz.startAsyncDisplay(30)
+            for t in range(T):
+                q = ...  # simulation step
+                viz.display(q)
+            viz.stopAsyncDisplay()
+        """
+        self.stopAsyncDisplay()
+        self._pendingQ = None
+        self._stopDisplay = threading.Event()
+        self._displayThread = threading.Thread(
+            target=self._displayLoop, args=(1.0 / rate,), daemon=True
+        )
+        self._displayThread.start()
+
+    def stopAsyncDisplay(self):
+        """Stop the display thread, after displaying the last stored configuration."""
+        if self._displayThread is None:
+            return
+        self._stopDisplay.set()
+        self._displayThread.join()
+        self._displayThread = None
+        self._displayPending()
+
+    def _displayLoop(self, period):
+        while not self._stopDisplay.wait(period):
+            self._displayPending()
+
+    def _displayPending(self):
+        with self._pendingLock:
+            pending, self._pendingQ = self._pendingQ, None
+        if pending is not None:
+            self._display(pending[0])
+
+    @_instrumented
+    def display(self, q=None):
+        if self._displayThread is not None and self.recorder is None:
+            # Stored in a tuple, as display(None) is also a valid request.
+            pending = (None if q is None else np.array(q),)
+            with self._pendingLock:
+                self._pendingQ = pending
+            return
+        self._display(q)
+
+    def _display(self, q):
+        if self.headless and self.recorder is None:
+            return
+        with self.batch():
+            super().display(q)
+        if self.recorder is not None:
+            self.recorder.nextFrame()
+
+    def play(self, q_trajectory, *args, **kwargs):
+        if self.recorder is None:
+            return super().play(q_trajectory, *args, **kwargs)
+        for q in q_trajectory:
+            self.display(q)
 
     def addSphere(self, name, radius, color):
         material = materialFromColor(color)
-        self.viewer[name].set_object(meshcat.geometry.Sphere(radius), material)
+        self.viewer[name].set_object(
+            _geometry(meshcat.geometry.Sphere, radius), material
+        )
 
     def addLine(self, name, point1, point2, color, linewidth=None):
         material = materialFromColor(color)
         if linewidth is not None:
+            # Materials are shared (see materialFromColor), so modify a copy.
+            material = copy.copy(material)
+            material.uuid = str(uuid.uuid1())
             # 1 by default set in the constructor of material
             # TODO: this does not seem to have any effect
             material.linewidth=linewidth
@@ -69,14 +412,19 @@ class MeshcatVisualizer(PMV):
     def addCylinder(self, name, length, radius, color=None):
         material = materialFromColor(color)
         self.viewer[name].set_object(
-            meshcat.geometry.Cylinder(length, radius), material
+            _geometry(meshcat.geometry.Cylinder, length, radius), material
         )
 
     def addBox(self, name, dims, color):
         material = materialFromColor(color)
-        self.viewer[name].set_object(meshcat.geometry.Box(dims), material)
+        self.viewer[name].set_object(
+            _geometry(meshcat.geometry.Box, tuple(dims)), material
+        )
 
+    @_instrumented
     def applyConfiguration(self, name, placement):
+        if self.headless and self.recorder is None:
+            return
         if isinstance(placement, list) or isinstance(placement, tuple):
             placement = np.array(placement)
         if isinstance(placement, pin.SE3):
@@ -97,6 +445,40 @@ class MeshcatVisualizer(PMV):
             return False
         self.viewer[name].set_transform(T)
 
+    @_instrumented
+    def applyConfigurations(self, names, placements):
+        """
+        Apply N placements to the N nodes <names> in one batch. <placements> is either
+        a (N,7) array of XYZ-quaternions, a (N,4,4) array of homogeneous matrices or
+        a list of pin.SE3.
+        """
+        if self.headless and self.recorder is None:
+            return
+        if len(placements) > 0 and isinstance(placements[0], pin.SE3):
+            placements = [M.homogeneous for M in placements]
+        placements = np.asarray(placements, dtype=float)
+        if placements.shape == (len(names), 7):
+            T = transformations.xyzquat2homogeneous(placements)
+        elif placements.shape == (len(names), 4, 4):
+            T = placements
+        else:
+            print("Error, np.shape of placements is not accepted")
+            return False
+        with self.batch():
+            for name, Ti in zip(names, T):
+                self.viewer[name].set_transform(Ti)
+
+    def stats(self):
+        """
+        Return the statistics (stats.Stats) of the calls to the viewer: number of
+        calls, bytes sent and latency histogram, for the wrapper methods (display,
+        applyConfiguration) and for the meshcat commands actually sent (set_object,
+        set_transform, delete, ...). print(viz.stats()) shows a summary table, and
+        viz.stats().reset() restarts the counting. Return None if the viewer was not
+        created with instrument=True.
+        """
+        return self.viewer.window.stats
+
     def delete(self, name):
         self.viewer[name].delete()
 
@@ -109,47 +491,58 @@ class MeshcatVisualizer(PMV):
 # --------------------------------------------------------------------------------
 # The next part of code is to reproduce the behavior of meshcat in pinocchio
 # 3 (version 2.99) inside pinocchio 2 (version 2.7).
+MsgType = Dict[str, Union[str, bytes, bool, float, "MsgType"]]
+ZAxis = np.array([0, 0, 1.0])
+
+
+class mgPlane(mg.Geometry):
+    """A plane of the given width and height.
+    """
+    def __init__(self, width: float, height: float, widthSegments: float = 1, heightSegments: float = 1):
+        super().__init__()
+        self.width = width
+        self.height = height
+        self.widthSegments = widthSegments
+        self.heightSegments = heightSegments
+
+    def lower(self, object_data: Any) -> MsgType:
+        return {
+            u"uuid": self.uuid,
+            u"type": u"PlaneGeometry",
+            u"width": self.width,
+            u"height": self.height,
+            u"widthSegments": self.widthSegments,
+            u"heightSegments": self.heightSegments,
+        }
+
+
+# Cylinders (and cones) need to be rotated
+basic_three_js_transform = np.array([[1.,  0.,  0.,  0.],
+              [0.,  0., -1.,  0.],
+              [0.,  1.,  0.,  0.],
+              [0.,  0.,  0.,  1.]])
+RotatedCylinder = type("RotatedCylinder", (mg.Cylinder,), {"intrinsic_transform": lambda self: basic_three_js_transform })
+
+# Meshcat geometries of the convex meshes already converted, indexed by convexKey.
+_convexMeshes = {}
+
+
+def _loadConvex(geom):
+    '''
+    Convert a hppfcl.ConvexBase into a meshcat geometry, only once per distinct mesh:
+    the same geometry object (hence the same uuid) is returned for the same content.
+    '''
+    key = convexKey(geom)
+    if key not in _convexMeshes:
+        _convexMeshes[key] = pin.visualize.meshcat_visualizer.loadMesh(geom)
+    return _convexMeshes[key]
+
+
 def _loadPrimitive(geometry_object: pin.GeometryObject):
     '''
-    Update the pin loadPrimitive function of Pinocchio2 by a code from 
+    Update the pin loadPrimitive function of Pinocchio2 by a code from
     pinocchio 2.99.
     '''
-    import warnings
-    import hppfcl
-    import meshcat.geometry as mg
-    from typing import Optional, Any, Dict, Union, Type, Set
-    MsgType = Dict[str, Union[str, bytes, bool, float, 'MsgType']]
-    pin.ZAxis=np.array([0,0,1.])
-    
-    class mgPlane(mg.Geometry):
-        """A plane of the given width and height. 
-        """
-        def __init__(self, width: float, height: float, widthSegments: float = 1, heightSegments: float = 1):
-            super().__init__()
-            self.width = width
-            self.height = height
-            self.widthSegments = widthSegments
-            self.heightSegments = heightSegments
-
-        def lower(self, object_data: Any) -> MsgType:
-            return {
-                u"uuid": self.uuid,
-                u"type": u"PlaneGeometry",
-                u"width": self.width,
-                u"height": self.height,
-                u"widthSegments": self.widthSegments,
-                u"heightSegments": self.heightSegments,
-            }
-
-    # Cylinders need to be rotated
-    basic_three_js_transform = np.array([[1.,  0.,  0.,  0.],
-                  [0.,  0., -1.,  0.],
-                  [0.,  1.,  0.,  0.],
-                  [0.,  0.,  0.,  1.]])
-    RotatedCylinder = type("RotatedCylinder", (mg.Cylinder,), {"intrinsic_transform": lambda self: basic_three_js_transform })
-
-    # Cones need to be rotated
-
     geom: hppfcl.ShapeBase = geometry_object.geometry
     if isinstance(geom, hppfcl.Capsule):
         if hasattr(mg, 'TriangularMeshGeometry'):
@@ -176,11 +569,11 @@ def _loadPrimitive(geometry_object: pin.GeometryObject):
     elif isinstance(geom, (hppfcl.Plane,hppfcl.Halfspace)):
         plane_transform : pin.SE3 = pin.SE3.Identity()
         # plane_transform.translation[:] = geom.d # Does not work
-        plane_transform.rotation = pin.Quaternion.FromTwoVectors(pin.ZAxis,geom.n).toRotationMatrix()
+        plane_transform.rotation = pin.Quaternion.FromTwoVectors(ZAxis,geom.n).toRotationMatrix()
         TransformedPlane = type("TransformedPlane", (mgPlane,), {"intrinsic_transform": lambda self: plane_transform.homogeneous })
         obj = TransformedPlane(1000,1000)
     elif isinstance(geom, hppfcl.ConvexBase):
-        obj = pin.visualize.meshcat_visualizer.loadMesh(geom)
+        obj = _loadConvex(geom)
     else:
         msg = "Unsupported geometry type for %s (%s)" % (geometry_object.name, type(geom) )
         warnings.warn(msg, category=UserWarning, stacklevel=2)
@@ -189,9 +582,6 @@ def _loadPrimitive(geometry_object: pin.GeometryObject):
     return obj
 
 
-# Update the pin2 version of loadPrimitive by the pin3 version
-pin.visualize.meshcat_visualizer.loadPrimitive = _loadPrimitive
-
 # -------------------------------------------------------------------------------
 # -------------------------------------------------------------------------------
 # -------------------------------------------------------------------------------
@@ -0,0 +1,176 @@
+"""
+Proxy on the meshcat ViewerWindow. All the commands sent to meshcat, either by the
+wrapper or by the pinocchio MeshcatVisualizer, go through window.send(command).
+This is then the place where the commands are buffered or filtered before reaching
+the server.
+"""
+
+import threading
+import time
+
+import numpy as np
+import umsgpack
+from meshcat.commands import SetAnimation, SetObject, SetProperty, SetTransform
+
+from .instancing import InstancedMesh
+
+
+class BufferedWindow:
+    """
+    Wrap a meshcat.visualizer.ViewerWindow. By default, the commands are directly
+    forwarded to the server. Between begin() and end(), they are stored and sent
+    in a single burst when the outermost end() is reached. Inside such a batch, a
+    transform of a node overwrites the previous (not yet sent) transform of the same
+    node, so that only the last one is sent.
+
+    The last transform sent for each node is kept in cache: if <tolerance> is not
+    None, a new transform which differs from the cached one by less than
+    <tolerance> (max over the matrix coefficients) is not sent at all.
+    Similarly, setting again on a node the object it already holds (same geometry
+    and material uuids) is not sent. The transforms of the nodes listed in <ignored>
+    are never sent (see instancing).
+
+    The window can be used from several threads (see asynchronous display): the
+    commands and the batches are serialized by a lock.
+
+    When <recording> is set (see recording.Recording), the transforms are stored in
+    it instead of being sent.
+
+    When <stats> is set (see stats.Stats), the latency and size of each command
+    actually sent to the server is counted, by kind of command.
+
+    If <window> is None, there is no server (headless viewer) and the commands are
+    simply dropped, without even being serialized.
+    """
+
+    def __init__(self, window, tolerance=None):
+        self.window = window
+        self.depth = 0
+        self.queue = []
+        self.pendingTransforms = {}  # path -> index of its SetTransform in queue
+        self.tolerance = tolerance
+        self.transforms = {}  # path -> last matrix sent
+        self.objects = {}  # path -> (geometry uuid, material uuid) of the last object
+        self.recording = None
+        self.ignored = set()  # paths of the nodes whose transforms are not sent
+        self.stats = None
+        self.lock = threading.RLock()
+
+    def __getattr__(self, name):
+        # web_url, get_scene, get_image, etc are handled by the true window.
+        return getattr(self.window, name)
+
+    def send(self, command):
+        with self.lock:
+            self._send(command)
+
+    def _send(self, command):
+        if self.recording is not None and isinstance(command, SetTransform):
+            self.recording.setTransform(command.path.lower(), command.matrix)
+            return
+        if self.window is None:
+            return
+
+        if isinstance(command, SetTransform):
+            if command.path.lower() in self.ignored:
+                return
+            if not self.changed(command.path.lower(), command.matrix):
+                return
+        elif isinstance(command, SetObject):
+            if not self.newObject(command.path.lower(), command.object):
+                return
+        elif isinstance(command, SetAnimation):
+            # The animated nodes are moved by the browser, so the cache is stale.
+            self.transforms.clear()
+        elif not isinstance(command, SetProperty) and hasattr(command, "path"):
+            self.forget(command.path.lower())
+
+        if self.depth == 0:
+            self.forward(command)
+        elif isinstance(command, SetTransform):
+            # The caller may reuse its matrix before the flush (e.g. display_witness).
+            command = SetTransform(np.array(command.matrix), command.path)
+            path = command.path.lower()
+            if path in self.pendingTransforms:
+                self.queue[self.pendingTransforms[path]] = command
+            else:
+                self.pendingTransforms[path] = len(self.queue)
+                self.queue.append(command)
+        else:
+            # Objects and deletions may change the meaning of the previous transforms
+            # (e.g. deleting a parent node), so stop merging across them.
+            self.pendingTransforms = {}
+            self.queue.append(command)
+
+    def changed(self, path, matrix):
+        """
+        Return True if <matrix> should be sent for the node <path>, and then store it
+        as the last transform of the node.
+        """
+        if self.tolerance is None:
+            return True
+        previous = self.transforms.get(path)
+        if previous is not None and np.max(np.abs(previous - matrix)) <= self.tolerance:
+            return False
+        self.transforms[path] = np.array(matrix, dtype=float)
+        return True
+
+    def newObject(self, path, obj):
+        """
+        Return True if <obj> should be sent for the node <path>, i.e. if the node does
+        not already hold the same geometry and material.
+        """
+        geometry, material = getattr(obj, "geometry", None), getattr(
+            obj, "material", None
+        )
+        key = None
+        if (
+            geometry is not None
+            and material is not None
+            and not isinstance(obj, InstancedMesh)  # same mesh, new placements
+        ):
+            key = (geometry.uuid, material.uuid)
+            if self.objects.get(path) == key:
+                return False
+        self.forget(path)
+        if key is not None:
+            self.objects[path] = key
+        return True
+
+    def forget(self, path):
+        """Remove the cached transforms and objects of the node <path> and of all its
+        children."""
+        prefix = path.rstrip("/") + "/"
+        for cache in [self.transforms, self.objects]:
+            for key in [k for k in cache if k == path or k.startswith(prefix)]:
+                del cache[key]
+
+    def begin(self):
+        with self.lock:
+            self.depth += 1
+
+    def end(self):
+        with self.lock:
+            assert self.depth > 0
+            self.depth -= 1
+            if self.depth == 0:
+                self.flush()
+
+    def flush(self):
+        with self.lock:
+            queue, self.queue = self.queue, []
+            self.pendingTransforms = {}
+            for command in queue:
+                self.forward(command)
+
+    def forward(self, command):
+        """Send <command> to the server."""
+        if self.stats is None:
+            self.window.send(command)
+            return
+        start = time.perf_counter()
+        self.window.send(command)
+        duration = time.perf_counter() - start
+        # Serialized again, only for counting, out of the measured time.
+        data = command.lower()
+        self.stats.add(data["type"], duration, len(umsgpack.packb(data)))
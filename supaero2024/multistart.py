@@ -0,0 +1,154 @@
+"""
+Multi-start of the obstacle-avoidance inverse geometry of tp0: several SLSQP solves,
+from different random collision-free initial configurations, run in parallel in a
+pool of processes, each one with its own copy of the robot. The first solution
+reaching the tolerance is returned, and the other solves are cancelled.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pinocchio as pin
+from scipy.optimize import fmin_slsqp
+
+from .collision_checking import collisionDistanceGradient
+from .load_ur5_with_obstacles import ur5_with_obstacles_scene
+
+
+class ObstacleIK:
+    """
+    The optimization problem of tp0: bring the end effector of <robot> (from
+    load_ur5_with_obstacles) to the 2D <target> (in the X,Z plane), under the
+    constraint that the robot does not collide with the obstacles. The cost and
+    constraint come with their analytic gradients.
+    """
+
+    def __init__(self, robot, target):
+        self.robot = robot
+        self.target = np.asarray(target, dtype=float)
+        self.frame = robot.model.nframes - 1
+
+    def endef(self, q):
+        pin.framesForwardKinematics(self.robot.model, self.robot.data, q)
+        return self.robot.data.oMf[self.frame].translation[[0, 2]]
+
+    def cost(self, q):
+        return np.sum((self.endef(q) - self.target) ** 2)
+
+    def costGradient(self, q):
+        model, data = self.robot.model, self.robot.data
+        J = pin.computeFrameJacobian(
+            model, data, q, self.frame, pin.LOCAL_WORLD_ALIGNED
+        )
+        return 2 * (self.endef(q) - self.target) @ J[[0, 2]]
+
+    def constraint(self, q):
+        robot = self.robot
+        pin.updateGeometryPlacements(
+            robot.model, robot.data, robot.collision_model, robot.collision_data, q
+        )
+        idx = pin.computeDistances(robot.collision_model, robot.collision_data)
+        return robot.collision_data.distanceResults[idx].min_distance
+
+    def constraintGradient(self, q):
+        """Jacobian (1xnq) of the constraint, see collisionDistanceGradient."""
+        robot = self.robot
+        grad = collisionDistanceGradient(
+            robot.model, robot.data, robot.collision_model, robot.collision_data, q
+        )
+        return grad[None]
+
+    def qrand(self, rng):
+        """Return a random collision-free configuration (qrand(check=True) of tp0)."""
+        robot = self.robot
+        while True:
+            q = rng.uniform(-3.2, 3.2, robot.model.nq)
+            pin.updateGeometryPlacements(
+                robot.model, robot.data, robot.collision_model, robot.collision_data, q
+            )
+            if not pin.computeCollisions(
+                robot.collision_model, robot.collision_data, True
+            ):
+                return q
+
+    def solve(self, x0, callback=None):
+        """Run SLSQP from <x0>, return the fmin_slsqp full output."""
+        return fmin_slsqp(
+            x0=x0,
+            func=self.cost,
+            fprime=self.costGradient,
+            f_ieqcons=self.constraint,
+            fprime_ieqcons=self.constraintGradient,
+            callback=callback,
+            full_output=1,
+            iprint=0,
+        )
+
+
+# State of each worker process, set by _initWorker.
+_worker = {}
+
+
+class _Cancelled(Exception):
+    pass
+
+
+def _initWorker(scene, target, cancel):
+    _worker["problem"] = ObstacleIK(scene.robot(), target)
+    _worker["cancel"] = cancel
+
+
+def _solve(seed):
+    """Solve from a random start drawn with <seed>. Return (q, cost, exit mode)."""
+    problem, cancel = _worker["problem"], _worker["cancel"]
+
+    def callback(q):
+        if cancel.is_set():
+            raise _Cancelled()
+
+    if cancel.is_set():
+        return None
+    try:
+        q, cost, _, mode, _ = problem.solve(
+            problem.qrand(np.random.default_rng(seed)), callback
+        )
+    except _Cancelled:
+        return None
+    return q, cost, mode
+
+
+def multistart(target, reduced=True, nstarts=16, workers=None, tolerance=1e-6, seed=0):
+    """
+    Solve the inverse geometry of tp0 (UR5 of load_ur5_with_obstacles, end effector
+    to the 2D <target>) from <nstarts> random initial configurations, in a pool of
+    <workers> processes (default to the number of CPUs). Return the first
+    configuration found with a cost below <tolerance> (the other solves are then
+    cancelled), or None.
+
+    >>> from supaero2024.load_ur5_with_obstacles import load_ur5_with_obstacles
+    >>> q = multistart([0.5, 0.5], nstarts=4, workers=2)
+    >>> problem = ObstacleIK(load_ur5_with_obstacles(reduced=True), [0.5, 0.5])
+    >>> bool(problem.cost(q) < 1e-6 and problem.constraint(q) > -1e-6)
+    True
+    """
+    cancel = multiprocessing.Event()
+    # The scene is built once here, and handed to the workers.
+    scene = ur5_with_obstacles_scene(reduced=reduced)
+    pool = ProcessPoolExecutor(
+        workers, initializer=_initWorker, initargs=(scene, target, cancel)
+    )
+    try:
+        futures = [pool.submit(_solve, seed + k) for k in range(nstarts)]
+        for future in as_completed(futures):
+            result = future.result()
+            if result is None:
+                continue
+            q, cost, mode = result
+            if mode == 0 and cost < tolerance:
+                return q
+        return None
+    finally:
+        # Stop the solves in progress at their next iteration, drop the others.
+        cancel.set()
+        pool.shutdown(cancel_futures=True)
@@ -0,0 +1,107 @@
+"""
+Closure of the kinematic loop of the parallel robot of load_ur5_parallel: the 4
+effectors tool0_#i are rigidly attached to the tool plate, so for a plate placement
+Mtool, the 24-dof configuration must be projected on the constraint manifold
+    oMtool0_#i(q) = Mtool * toolMeff_i, for i = 0..3.
+Each arm only moves its own effector, so the constraint is block diagonal: the 4
+6-dof blocks are solved independently (as one batch of 6x6 systems) by a
+Levenberg-Marquardt descent on the SE3 log of the effector errors.
+"""
+
+import numpy as np
+import pinocchio as pin
+
+from .compatibility import frameParentJoint
+
+
+class LoopClosure:
+    """
+    Loop-closure solver for <robot> (from load_ur5_parallel). The placements of the
+    effectors in the tool plate (toolMeffs) are those of configuration <q0>
+    (default robot.q0) with the plate at <Mref> (default centered between the
+    effectors, with the world orientation). <damping> is the minimal damping of
+    the least squares.
+
+    Each call to solve() starts from the previous solution (warm start), so that
+    following a slowly moving plate, e.g. at control rate, only takes one or two
+    iterations, and stays on the same branch of inverse geometry.
+
+    >>> from supaero2024.load_ur5_parallel import load_ur5_parallel
+    >>> robot = load_ur5_parallel()
+    >>> closure = LoopClosure(robot)
+    >>> Mtool = pin.SE3(pin.utils.rotate("z", 0.3), np.array([0.05, 0, 0.7]))
+    >>> q = closure.solve(Mtool)
+    >>> bool(np.abs(closure.errors(q, Mtool)).max() < 1e-8)
+    True
+    >>> Mtool.translation[2] += 0.01
+    >>> q = closure.solve(Mtool)
+    >>> closure.iterations <= 3
+    True
+    """
+
+    def __init__(self, robot, q0=None, Mref=None, damping=1e-6):
+        self.model = robot.model
+        self.data = robot.model.createData()
+        self.frames = [self.model.getFrameId("tool0_#%d" % i) for i in range(4)]
+        # Indexes of the 6 joints of each arm (revolute joints, so that their
+        # indexes in q and in v are the same).
+        self.blocks = np.array(
+            [
+                [
+                    self.model.joints[j].idx_v
+                    for j in self.model.supports[frameParentJoint(self.model.frames[f])]
+                    if j > 0
+                ]
+                for f in self.frames
+            ]
+        )
+        self.q = (robot.q0 if q0 is None else q0).copy()
+        pin.framesForwardKinematics(self.model, self.data, self.q)
+        oMeffs = [self.data.oMf[f].copy() for f in self.frames]
+        if Mref is None:
+            center = np.mean([M.translation for M in oMeffs], axis=0)
+            Mref = pin.SE3(np.eye(3), center)
+        self.toolMeffs = [Mref.inverse() * M for M in oMeffs]
+        self.damping = damping
+        self.iterations = 0
+
+    def errors(self, q, Mtool):
+        """Return the (4,6) log errors of the effector placements at <q>."""
+        pin.framesForwardKinematics(self.model, self.data, q)
+        return np.array(
+            [
+                pin.log6((Mtool * toolMeff).actInv(self.data.oMf[f])).vector
+                for f, toolMeff in zip(self.frames, self.toolMeffs)
+            ]
+        )
+
+    def solve(self, Mtool, q=None, tolerance=1e-10, maxiter=50):
+        """
+        Project the configuration <q> (default: the previous solution) on the
+        constraint manifold of the plate placement <Mtool>, and return it. The
+        number of iterations is stored in self.iterations.
+        """
+        q = (self.q if q is None else q).copy()
+        model, data = self.model, self.data
+        targets = [Mtool * toolMeff for toolMeff in self.toolMeffs]
+        err = np.zeros([4, 6])
+        J = np.zeros([4, 6, 6])
+        for self.iterations in range(maxiter + 1):
+            # The Jacobians of the 4 frames from one pass on the kinematic tree.
+            pin.computeJointJacobians(model, data, q)
+            pin.updateFramePlacements(model, data)
+            for i, (f, target) in enumerate(zip(self.frames, targets)):
+                targetMeff = target.actInv(data.oMf[f])
+                err[i] = pin.log6(targetMeff).vector
+                Jf = pin.getFrameJacobian(model, data, f, pin.LOCAL)
+                J[i] = pin.Jlog6(targetMeff) @ Jf[:, self.blocks[i]]
+            if np.max(np.sum(err**2, axis=1)) < tolerance**2:
+                break
+            # Damped least squares for the 4 blocks at once, the damping decreasing
+            # with the error for a fast convergence near the solution.
+            lam = np.sum(err**2, axis=1)[:, None, None] + self.damping
+            JJt = J @ J.transpose(0, 2, 1) + lam * np.eye(6)
+            dq = -J.transpose(0, 2, 1) @ np.linalg.solve(JJt, err[..., None])
+            q[self.blocks] += dq[..., 0]
+        self.q = q
+        return q
@@ -0,0 +1,166 @@
+"""
+Post-processing of the (often jagged) paths given by the planners, e.g. the random
+descent of tp0, the PRM or RRT-Connect: randomized shortcuts, removal of the
+redundant waypoints, then time parameterization by a cubic spline.
+All the collision checks are batched, see CollisionChecker.
+"""
+
+import numpy as np
+from scipy.interpolate import CubicSpline, PPoly
+
+from .prm import validSegments
+
+
+def pathLength(path):
+    """Return the length of the piecewise-linear <path> ((K,nq) array)."""
+    return np.sum(np.linalg.norm(np.diff(path, axis=0), axis=1))
+
+
+def shortcut(path, collide, step=0.05, iterations=50, batch=16, rng=np.random):
+    """
+    Randomized shortcuts: at each of the <iterations>, <batch> random pairs of
+    points of <path> (on its segments) are drawn, the straight segments between them
+    (and their ends) are checked at once (at the resolution <step>, with the batched
+    <collide>), and the valid one shortening the path the most replaces the part of
+    the path between its ends. Return the new path.
+    """
+    path = np.array(path, dtype=float)
+    for _ in range(iterations):
+        if len(path) < 3:
+            break
+        lengths = np.linalg.norm(np.diff(path, axis=0), axis=1)
+        # Curvilinear abscissa of the waypoints, and of random pairs of points.
+        s = np.concatenate([[0], np.cumsum(lengths)])
+        sa, sb = np.sort(rng.uniform(0, s[-1], [2, batch]), axis=0)
+        ia = np.minimum(np.searchsorted(s, sa, side="right") - 1, len(path) - 2)
+        ib = np.minimum(np.searchsorted(s, sb, side="right") - 1, len(path) - 2)
+        keep = ib > ia  # Shortcuts inside a segment are useless.
+        if not keep.any():
+            continue
+        sa, sb, ia, ib = sa[keep], sb[keep], ia[keep], ib[keep]
+        ta = ((sa - s[ia]) / np.maximum(lengths[ia], 1e-12))[:, None]
+        tb = ((sb - s[ib]) / np.maximum(lengths[ib], 1e-12))[:, None]
+        qa = path[ia] + ta * (path[ia + 1] - path[ia])
+        qb = path[ib] + tb * (path[ib + 1] - path[ib])
+        gain = (sb - sa) - np.linalg.norm(qb - qa, axis=1)
+        # The new ends lie between the checked points of the old segments.
+        valid = validSegments(collide, qa, qb, step)
+        valid &= ~collide(np.concatenate([qa, qb])).reshape(2, -1).any(axis=0)
+        if not (valid & (gain > 1e-9)).any():
+            continue
+        k = np.argmax(np.where(valid, gain, -np.inf))
+        path = np.concatenate(
+            [path[: ia[k] + 1], [qa[k], qb[k]], path[ib[k] + 1 :]], axis=0
+        )
+    return path
+
+
+def pruneWaypoints(path, collide, step=0.05):
+    """
+    Remove the redundant waypoints of <path>: from each kept waypoint, jump to the
+    farthest waypoint reachable by a valid straight segment (all the candidates
+    being checked in one batch). The first and last waypoints are kept.
+    """
+    path = np.asarray(path, dtype=float)
+    kept = [0]
+    while kept[-1] < len(path) - 1:
+        i = kept[-1]
+        candidates = np.arange(i + 1, len(path))
+        valid = validSegments(
+            collide, path[[i] * len(candidates)], path[candidates], step
+        )
+        # The next waypoint is always reachable, by construction of the path.
+        valid[0] = True
+        kept.append(candidates[np.flatnonzero(valid)[-1]])
+    return path[kept]
+
+
+def _discretize(path, step):
+    """
+    Return the segment index and the parameter in [0,1) of the points discretizing
+    each segment of <path> with a maximal <step>, as in validSegments.
+    """
+    lengths = np.linalg.norm(np.diff(path, axis=0), axis=1)
+    counts = np.maximum(np.ceil(lengths / step).astype(int), 1)
+    segment = np.repeat(np.arange(len(lengths)), counts)
+    first = np.cumsum(counts) - counts
+    return segment, (np.arange(len(segment)) - first[segment]) / counts[segment]
+
+
+def _fitSpline(path, velocity):
+    lengths = np.linalg.norm(np.diff(path, axis=0), axis=1)
+    times = np.concatenate([[0], np.cumsum(np.maximum(lengths, 1e-9))]) / velocity
+    return CubicSpline(times, path, bc_type="clamped")
+
+
+def timeParameterize(path, velocity=1.0, collide=None, step=0.05, maxrefine=5):
+    """
+    Fit a cubic spline through the waypoints of <path>, starting and ending at rest,
+    each segment lasting its length divided by the mean joint <velocity> (rad/s).
+    Return the spline (a scipy CubicSpline, q(t) = spline(t)), whose duration is
+    spline.x[-1].
+
+    If <collide> is given, the spline is checked at the resolution <step> (in one
+    batch), and the middles of the segments where it collides are added as
+    waypoints before fitting it again, up to <maxrefine> times. If it still
+    collides, the spline is fitted through the points of the segments of <path>
+    checked by validSegments, which are known free, and checked again. If even this
+    one collides, the piecewise-linear interpolation of <path> is returned instead
+    (a scipy PPoly of degree 1, with the same timing, not at rest at the waypoints).
+
+    >>> path = np.array([[0.0, 0], [1, 0], [1, 1]])
+    >>> spline = timeParameterize(path, collide=lambda qs: np.ones(len(qs), bool))
+    >>> spline.x
+    array([0., 1., 2.])
+    >>> np.allclose(spline([0.5, 1.5]), [[0.5, 0], [1, 0.5]])
+    True
+    """
+    path = waypoints = np.asarray(path, dtype=float)
+    for _ in range(maxrefine + 1):
+        spline = _fitSpline(path, velocity)
+        if collide is None:
+            return spline
+        segment, t = _discretize(path, step)
+        samples = spline(spline.x[segment] + t * np.diff(spline.x)[segment])
+        colliding = np.unique(segment[collide(samples)])
+        if len(colliding) == 0:
+            return spline
+        middles = (path[colliding] + path[colliding + 1]) / 2
+        path = np.insert(path, colliding + 1, middles, axis=0)
+    segment, t = _discretize(waypoints, step)
+    points = waypoints[segment] + t[:, None] * np.diff(waypoints, axis=0)[segment]
+    points = np.concatenate([points, waypoints[-1:]])
+    spline = _fitSpline(points, velocity)
+    segment, t = _discretize(points, step)
+    if not collide(spline(spline.x[segment] + t * np.diff(spline.x)[segment])).any():
+        return spline
+    # The segments of the path are valid, so is its linear interpolation.
+    times = _fitSpline(waypoints, velocity).x
+    slopes = np.diff(waypoints, axis=0) / np.diff(times)[:, None]
+    return PPoly(np.stack([slopes, waypoints[:-1]]), times)
+
+
+def smoothPath(path, collide, step=0.05, velocity=1.0, iterations=50, rng=np.random):
+    """
+    Shortcut <path>, remove its redundant waypoints and time-parameterize it (see
+    shortcut, pruneWaypoints and timeParameterize). Return the spline.
+
+    >>> from supaero2024.collision_checking import CollisionChecker
+    >>> from supaero2024.load_ur5_with_obstacles import load_ur5_with_obstacles
+    >>> from supaero2024.rrt import RRTConnect
+    >>> checker = CollisionChecker(load_ur5_with_obstacles())
+    >>> rng = np.random.default_rng(0)
+    >>> start, goal = checker.sampleFree(2, rng=rng)
+    >>> path = RRTConnect(checker, step=0.1, rng=rng).plan(start, goal)
+    >>> spline = smoothPath(path, checker, rng=rng)
+    >>> len(spline.x) < len(path)
+    True
+    >>> qs = spline(np.linspace(0, spline.x[-1], 200))
+    >>> np.allclose(qs[0], start) and np.allclose(qs[-1], goal)
+    True
+    >>> bool(pathLength(qs) < pathLength(path))
+    True
+    """
+    path = shortcut(path, collide, step, iterations, rng=rng)
+    path = pruneWaypoints(path, collide, step)
+    return timeParameterize(path, velocity, collide, step)
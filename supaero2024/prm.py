@@ -0,0 +1,160 @@
+"""
+Probabilistic roadmap (PRM) planner, e.g. for the robot of load_ur5_with_obstacles.
+The roadmap is built once on a given obstacle field, then answers many start/goal
+queries by A* search, with a bounded cost per query.
+"""
+
+import heapq
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+def validSegments(collide, qa, qb, step):
+    """
+    Return the mask of the segments [<qa>[i],<qb>[i]] (two (M,nq) arrays) which are
+    free of collision, when discretized with a maximal <step>. The ends of the
+    segments are not checked. <collide> is a batched collision check, mapping a
+    (N,nq) array to its N-length collision mask (see CollisionChecker).
+    """
+    qa, qb = np.atleast_2d(qa), np.atleast_2d(qb)
+    lengths = np.linalg.norm(qb - qa, axis=1)
+    counts = np.maximum(np.ceil(lengths / step).astype(int), 1)
+    # All the intermediate points of all the segments are checked in one batch.
+    edge = np.repeat(np.arange(len(qa)), counts - 1)
+    first = np.cumsum(counts - 1) - (counts - 1)
+    k = np.arange(len(edge)) - first[edge] + 1
+    t = (k / counts[edge])[:, None]
+    points = qa[edge] + t * (qb - qa)[edge]
+    if len(points) == 0:
+        return np.ones(len(qa), dtype=bool)
+    collisions = np.bincount(edge, weights=collide(points), minlength=len(qa))
+    return collisions == 0
+
+
+class PRM:
+    """
+    Roadmap of <nnodes> collision-free configurations drawn by <sample> (mapping n
+    to a (n,nq) array of free configurations), each one linked to its <neighbors>
+    nearest nodes (found with a KD-tree). The edges are straight lines, valid if
+    free of collision at the resolution <step>, checked with the batched
+    <collide> (mapping a (N,nq) array to its collision mask). With CollisionChecker:
+        checker = CollisionChecker(robot)
+        prm = PRM(checker, checker.sampleFree)
+    and with the single-configuration coll and qrand of tp0:
+        prm = PRM(lambda qs: np.array([coll(q) for q in qs]),
+                  lambda n: np.array([qrand(check=True) for _ in range(n)]))
+
+    If <lazy> is False, all the edges are checked when building the roadmap.
+    Otherwise, they are only checked when they belong to a candidate path during a
+    query (lazy PRM). In both cases, the validity of the edges is cached for the
+    next queries.
+
+    >>> from supaero2024.collision_checking import CollisionChecker
+    >>> from supaero2024.load_ur5_with_obstacles import load_ur5_with_obstacles
+    >>> checker = CollisionChecker(load_ur5_with_obstacles(reduced=True))
+    >>> np.random.seed(2)
+    >>> prm = PRM(checker, checker.sampleFree, nnodes=100, lazy=True)
+    >>> start, goal = prm.nodes[0], prm.nodes[1]
+    >>> path = prm.query(start, goal)
+    >>> np.allclose(path[0], start) and np.allclose(path[-1], goal)
+    True
+    >>> bool(validSegments(checker, path[:-1], path[1:], prm.step).all())
+    True
+    """
+
+    def __init__(
+        self, collide, sample, nnodes=500, neighbors=10, step=0.05, lazy=False
+    ):
+        self.collide = collide
+        self.step = step
+        self.neighbors = neighbors
+        self.nodes = np.asarray(sample(nnodes), dtype=float)
+        self.tree = cKDTree(self.nodes)
+
+        # Each node is linked to its nearest neighbors, edges stored with i < j.
+        _, nearest = self.tree.query(self.nodes, min(neighbors + 1, len(self.nodes)))
+        pairs = {
+            (min(i, j), max(i, j))
+            for i, row in enumerate(nearest)
+            for j in row[1:]
+            if j < len(self.nodes)
+        }
+        self.edges = {pair: None for pair in sorted(pairs)}  # None if not checked
+        self.graph = [[] for _ in self.nodes]
+        for i, j in self.edges:
+            self.graph[i].append(j)
+            self.graph[j].append(i)
+        if not lazy:
+            self.checkEdges(list(self.edges))
+
+    def checkEdges(self, pairs):
+        """Check (in one batch) and cache the validity of the edges <pairs>."""
+        pairs = [pair for pair in pairs if self.edges[pair] is None]
+        if not pairs:
+            return
+        i, j = np.array(pairs).T
+        valid = validSegments(self.collide, self.nodes[i], self.nodes[j], self.step)
+        for pair, v in zip(pairs, valid):
+            self.edges[pair] = bool(v)
+
+    def _connect(self, q):
+        """Return the nodes to which <q> can be linked by a valid edge."""
+        _, nearest = self.tree.query(q, min(self.neighbors, len(self.nodes)))
+        nearest = np.atleast_1d(nearest)
+        valid = validSegments(
+            self.collide, np.tile(q, [len(nearest), 1]), self.nodes[nearest], self.step
+        )
+        return list(nearest[valid])
+
+    def _astar(self, start, goal, starts, goals):
+        """
+        A* search in the roadmap, from the virtual node <start> linked to the nodes
+        <starts> to the virtual node <goal> linked to <goals>, through the edges
+        not known to be invalid. Return the list of the node indexes, or None.
+        """
+        goals = set(goals)
+        cost = {i: np.linalg.norm(self.nodes[i] - start) for i in starts}
+        parent = {i: None for i in starts}
+        heap = [(c + np.linalg.norm(self.nodes[i] - goal), i) for i, c in cost.items()]
+        heapq.heapify(heap)
+        closed = set()
+        while heap:
+            _, i = heapq.heappop(heap)
+            if i in closed:
+                continue
+            if i in goals:
+                path = [i]
+                while parent[path[-1]] is not None:
+                    path.append(parent[path[-1]])
+                return path[::-1]
+            closed.add(i)
+            for j in self.graph[i]:
+                if j in closed or self.edges[(min(i, j), max(i, j))] is False:
+                    continue
+                c = cost[i] + np.linalg.norm(self.nodes[j] - self.nodes[i])
+                if c < cost.get(j, np.inf):
+                    cost[j], parent[j] = c, i
+                    heapq.heappush(heap, (c + np.linalg.norm(self.nodes[j] - goal), j))
+        return None
+
+    def query(self, start, goal):
+        """
+        Return a collision-free path from <start> to <goal> as an array of
+        configurations (the first one being start and the last one goal), or None
+        if there is none in the roadmap.
+        """
+        start, goal = np.asarray(start, dtype=float), np.asarray(goal, dtype=float)
+        if self.collide(np.array([start, goal])).any():
+            return None
+        if validSegments(self.collide, start, goal, self.step)[0]:
+            return np.array([start, goal])
+        starts, goals = self._connect(start), self._connect(goal)
+        while True:
+            nodes = self._astar(start, goal, starts, goals)
+            if nodes is None:
+                return None
+            pairs = [(min(i, j), max(i, j)) for i, j in zip(nodes[:-1], nodes[1:])]
+            self.checkEdges(pairs)  # Only does something in the lazy case.
+            if all(self.edges[pair] for pair in pairs):
+                return np.array([start] + [self.nodes[i] for i in nodes] + [goal])
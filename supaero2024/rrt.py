@@ -0,0 +1,275 @@
+"""
+RRT-Connect planner, e.g. for the robot of load_ur5_with_obstacles (full or
+reduced). The two trees are grown without checking their edges, which are only
+checked (coarse to fine) once they belong to a path connecting the start to the
+goal.
+"""
+
+import numpy as np
+
+# A distance query costs about as much as this number of collision checks (UR5
+# meshes against capsules), hence is only worth it inside long uncertified spans.
+DISTANCE_COST = 100
+
+
+def bisectSegments(collide, qa, qb, resolution, certified=None, certify=None):
+    """
+    Return the mask of the segments [<qa>[i],<qb>[i]] (two (M,nq) arrays) which are
+    free of collision at the given <resolution>, the ends being known free.
+    The segments are checked coarse to fine: first all their midpoints (in one
+    batch of the batched <collide>, see CollisionChecker), then the quarter points
+    of the segments still valid, etc, so that a collision is found early.
+
+    The parts of the segments known free are not checked: <certified> is an optional
+    (M,2) array [ta,tb] meaning that the parts [0,ta] and [tb,1] of the segments
+    are free. <certify> optionally maps a (N,nq) array of midpoints and the indexes
+    of their segments to the radius (in segment parameter) of their free
+    neighborhood. As it is costly, it is only called for the midpoints of the
+    intervals whose uncertified part needs more than DISTANCE_COST collision checks.
+    So the bisection only goes on where the segments come close to the obstacles,
+    and the segments which are certified free along their whole length are not
+    checked at all.
+
+    >>> def collide(qs):
+    ...     calls.append(len(qs))
+    ...     return np.linalg.norm(qs, axis=1) < 1  # The unit disk is an obstacle.
+    >>> qa = np.array([[-2.0, 1.5], [-2.0, 0.5]])
+    >>> qb = np.array([[2.0, 1.5], [2.0, 0.5]])
+    >>> calls = []
+    >>> bisectSegments(collide, qa, qb, 0.1).tolist(), calls[:3]
+    ([True, False], [2, 2, 4])
+    >>> calls = []
+    >>> bisectSegments(collide, qa[:1], qb[:1], 0.1, certified=[[0.6, 0.4]]), calls
+    (array([ True]), [])
+    >>> def certify(points, edges):  # Distance to the disk over segment length
+    ...     return (np.linalg.norm(points, axis=1) - 1) / 4
+    >>> calls = []
+    >>> bisectSegments(collide, qa[:1], qb[:1], 1e-3), sum(calls)
+    (array([ True]), 4095)
+    >>> calls = []
+    >>> bisectSegments(collide, qa[:1], qb[:1], 1e-3, certify=certify), sum(calls)
+    (array([ True]), 3)
+    """
+    qa, qb = np.atleast_2d(qa), np.atleast_2d(qb)
+    lengths = np.linalg.norm(qb - qa, axis=1)
+    if certified is None:
+        certified = np.zeros([len(qa), 2])
+        certified[:, 1] = 1
+    certified = np.asarray(certified, dtype=float)
+    valid = np.ones(len(qa), dtype=bool)
+    # Pending intervals [t0,t1] of the segments e, free in [t0,t0+r0] and [t1-r1,t1].
+    e = np.arange(len(qa))
+    t0, t1 = np.zeros(len(qa)), np.ones(len(qa))
+    r0, r1 = certified[:, 0], 1 - certified[:, 1]
+    while True:
+        uncertified = (t1 - r1) - (t0 + r0)
+        keep = valid[e] & (uncertified > 0) & ((t1 - t0) * lengths[e] > resolution)
+        e, t0, t1, r0, r1 = e[keep], t0[keep], t1[keep], r0[keep], r1[keep]
+        if len(e) == 0:
+            return valid
+        tm = (t0 + t1) / 2
+        points = qa[e] + tm[:, None] * (qb - qa)[e]
+        inside = (tm > t0 + r0) & (tm < t1 - r1)  # Not in a certified part
+        collisions = np.zeros(len(e), dtype=bool)
+        collisions[inside] = collide(points[inside])
+        valid[e[collisions]] = False
+        rm = np.zeros(len(e))
+        if certify is not None:
+            costly = ~collisions & (
+                uncertified[keep] * lengths[e] / resolution > DISTANCE_COST
+            )
+            if costly.any():
+                rm[costly] = certify(points[costly], e[costly])
+        # Split each interval at its midpoint.
+        e, t0, t1 = np.r_[e, e], np.r_[t0, tm], np.r_[tm, t1]
+        r0, r1 = np.r_[r0, rm], np.r_[rm, r1]
+
+
+class _Tree:
+    """Nodes of one tree of RRT-Connect, stored in arrays growing by chunks."""
+
+    def __init__(self, root):
+        self.nodes = np.zeros([64, len(root)])
+        self.nodes[0] = root
+        self.parent = np.full(64, -1)
+        self.alive = np.zeros(64, dtype=bool)
+        self.alive[0] = True
+        self.checked = np.ones(64, dtype=bool)  # if the edge to the parent is valid
+        self.distance = np.full(64, np.nan)  # distance to the obstacles, if computed
+        self.size = 1
+
+    def add(self, q, parent):
+        if self.size == len(self.nodes):
+            self.nodes = np.concatenate([self.nodes, np.zeros_like(self.nodes)])
+            for name, fill in [
+                ("parent", -1),
+                ("alive", False),
+                ("checked", True),
+                ("distance", np.nan),
+            ]:
+                array = getattr(self, name)
+                setattr(self, name, np.concatenate([array, np.full_like(array, fill)]))
+        i = self.size
+        self.nodes[i], self.parent[i], self.alive[i] = q, parent, True
+        self.checked[i] = False
+        self.size += 1
+        return i
+
+    def nearest(self, q):
+        d = np.sum((self.nodes[: self.size] - q) ** 2, axis=1)
+        d[~self.alive[: self.size]] = np.inf
+        return int(np.argmin(d))
+
+    def branch(self, i):
+        """Return the node indexes from the root to <i>."""
+        branch = [i]
+        while self.parent[branch[-1]] >= 0:
+            branch.append(self.parent[branch[-1]])
+        return branch[::-1]
+
+    def prune(self, i):
+        """Remove the node <i> and its descendants."""
+        self.alive[i] = False
+        # The children are always added after their parent.
+        for k in range(i + 1, self.size):
+            if self.alive[k] and not self.alive[self.parent[k]]:
+                self.alive[k] = False
+
+
+class RRTConnect:
+    """
+    Plan collision-free paths with RRT-Connect, the configurations being sampled
+    uniformly in the box [<low>,<high>]. The trees are extended by steps of at most
+    <step>, and the edges are valid if free at <resolution>.
+
+    <checker> is a CollisionChecker: its batched call is used for the edges, and
+    its distance() (with its displacementBounds) certifies a free neighborhood of
+    the ends of every edge, so that only their middle part is checked, if any (see
+    bisectSegments). The number of edges certified without any collision check is
+    counted in certifiedEdges.
+
+    >>> from supaero2024.collision_checking import CollisionChecker
+    >>> from supaero2024.load_ur5_with_obstacles import load_ur5_with_obstacles
+    >>> checker = CollisionChecker(load_ur5_with_obstacles())
+    >>> rrt = RRTConnect(checker, rng=np.random.default_rng(0))
+    >>> start, goal = checker.sampleFree(2, rng=np.random.default_rng(1))
+    >>> path = rrt.plan(start, goal)
+    >>> np.allclose(path[0], start) and np.allclose(path[-1], goal)
+    True
+    >>> bool(bisectSegments(checker, path[:-1], path[1:], rrt.resolution).all())
+    True
+
+    Far from the obstacles, the edges are certified free without collision check:
+    >>> checker = CollisionChecker(load_ur5_with_obstacles(reduced=True))
+    >>> rrt = RRTConnect(checker, rng=np.random.default_rng(0))
+    >>> path = rrt.plan(*checker.sampleFree(2, rng=np.random.default_rng(1)))
+    >>> path is not None and rrt.certifiedEdges > 0
+    True
+    """
+
+    def __init__(
+        self,
+        checker,
+        low=-3.2,
+        high=3.2,
+        step=0.5,
+        resolution=0.05,
+        maxiter=5000,
+        rng=np.random,
+    ):
+        self.checker = checker
+        self.low, self.high = low, high
+        self.step = step
+        self.resolution = resolution
+        self.maxiter = maxiter
+        self.rng = rng
+        self.certifiedEdges = 0  # Edges certified free without any collision check
+
+    def _extend(self, tree, q):
+        """
+        Add to <tree> a node in the direction of <q>, at most at <step> from the
+        nearest node. Return the index of the new node (None if it is in collision)
+        and True if <q> is reached.
+        """
+        i = tree.nearest(q)
+        delta = q - tree.nodes[i]
+        length = np.linalg.norm(delta)
+        reached = length <= self.step
+        qnew = q if reached else tree.nodes[i] + delta * self.step / length
+        if self.checker(qnew[None])[0]:
+            return None, False
+        return tree.add(qnew, i), reached
+
+    def _connect(self, tree, q):
+        """Extend <tree> toward <q> until reaching it or colliding."""
+        while True:
+            i, reached = self._extend(tree, q)
+            if i is None or reached:
+                return i, reached
+
+    def _distance(self, tree, i):
+        if np.isnan(tree.distance[i]):
+            tree.distance[i] = max(self.checker.distance(tree.nodes[i]), 0)
+        return tree.distance[i]
+
+    def _checkBranch(self, tree, branch):
+        """
+        Check the unchecked edges of <branch> (node indexes from the root). Prune the
+        invalid ones from <tree>, and return True if all are valid.
+        """
+        children = [i for i in branch if not tree.checked[i]]
+        if not children:
+            return True
+        qa, qb = tree.nodes[tree.parent[children]], tree.nodes[children]
+        # Moving by dq moves the geometries of any collision pair closer by at most
+        # bounds @ |dq|, so the robot stays free around a node at distance d over
+        # d / move of the edge (the distances of the nodes are computed once, and
+        # shared by edges).
+        move = np.maximum(np.abs(qb - qa) @ self.checker.bounds, 1e-12)
+        certified = np.zeros([len(children), 2])
+        certified[:, 0] = [self._distance(tree, tree.parent[i]) for i in children]
+        certified[:, 1] = [self._distance(tree, i) for i in children]
+        certified /= move[:, None]
+        certified[:, 1] = 1 - certified[:, 1]
+        self.certifiedEdges += int(np.sum(certified[:, 0] >= certified[:, 1]))
+
+        def certify(points, edges):
+            d = [max(self.checker.distance(q), 0) for q in points]
+            return np.array(d) / move[edges]
+
+        valid = bisectSegments(
+            self.checker, qa, qb, self.resolution, certified, certify
+        )
+        tree.checked[children] = valid
+        for i in np.array(children)[~valid]:
+            tree.prune(i)
+        return bool(valid.all())
+
+    def plan(self, start, goal):
+        """
+        Return a collision-free path from <start> to <goal> as an array of
+        configurations, or None if none was found after <maxiter> iterations.
+        """
+        start, goal = np.asarray(start, dtype=float), np.asarray(goal, dtype=float)
+        if self.checker(np.array([start, goal])).any():
+            return None
+        trees = [_Tree(start), _Tree(goal)]
+        for it in range(self.maxiter):
+            a, b = trees if it % 2 == 0 else trees[::-1]
+            qrand = self.rng.uniform(self.low, self.high, len(start))
+            i, _ = self._extend(a, qrand)
+            if i is None:
+                continue
+            j, reached = self._connect(b, a.nodes[i])
+            if not reached:
+                continue
+            # The trees are connected, now check the edges of the path.
+            branchA, branchB = a.branch(i), b.branch(j)
+            validA = self._checkBranch(a, branchA)
+            validB = self._checkBranch(b, branchB)
+            if validA and validB:
+                # Node j of b is at the same place as node i of a.
+                path = [a.nodes[k] for k in branchA]
+                path += [b.nodes[k] for k in branchB[-2::-1]]
+                return np.array(path if a is trees[0] else path[::-1])
+        return None
@@ -0,0 +1,41 @@
+"""
+Models of a robot and of its environment, shared between the robots built on them,
+e.g. by load_ur5_with_obstacles and load_ur5_parallel.
+"""
+
+import pinocchio as pin
+
+
+class Scene:
+    """
+    Models of a robot and of its obstacle field, built once and then shared: robot()
+    returns a new robot on copies of the models, with fresh data.
+    A scene can be pickled, e.g. to be sent to worker processes, which then do not
+    need to parse the URDF. The visual model (whose meshes are large) is left out,
+    so the robots of an unpickled scene have an empty visual model.
+    """
+
+    def __init__(self, model, collision_model, visual_model, q0):
+        self.model = model
+        self.collision_model = collision_model
+        self.visual_model = visual_model
+        self.q0 = q0
+
+    def robot(self):
+        visual_model = (
+            pin.GeometryModel()
+            if self.visual_model is None
+            else self.visual_model.copy()
+        )
+        robot = pin.RobotWrapper(
+            self.model.copy(), self.collision_model.copy(), visual_model
+        )
+        robot.q0 = self.q0.copy()
+        return robot
+
+    def __getstate__(self):
+        return self.model, self.collision_model, self.q0
+
+    def __setstate__(self, state):
+        self.model, self.collision_model, self.q0 = state
+        self.visual_model = None
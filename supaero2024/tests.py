@@ -1,8 +1,30 @@
 import doctest
 
-from supaero2024 import load_ur5_parallel
+from supaero2024 import (
+    broadphase,
+    collision_checking,
+    compatibility,
+    configuration_grid,
+    load_ur5_parallel,
+    load_ur5_with_obstacles,
+    multistart,
+    parallel_closure,
+    path_smoothing,
+    prm,
+    rrt,
+)
 
 
 def load_tests(loader, tests, pattern):
+    tests.addTests(doctest.DocTestSuite(broadphase))
+    tests.addTests(doctest.DocTestSuite(collision_checking))
+    tests.addTests(doctest.DocTestSuite(compatibility))
+    tests.addTests(doctest.DocTestSuite(configuration_grid))
     tests.addTests(doctest.DocTestSuite(load_ur5_parallel))
+    tests.addTests(doctest.DocTestSuite(load_ur5_with_obstacles))
+    tests.addTests(doctest.DocTestSuite(multistart))
+    tests.addTests(doctest.DocTestSuite(parallel_closure))
+    tests.addTests(doctest.DocTestSuite(path_smoothing))
+    tests.addTests(doctest.DocTestSuite(prm))
+    tests.addTests(doctest.DocTestSuite(rrt))
     return tests
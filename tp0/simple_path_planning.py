@@ -7,6 +7,7 @@ import pinocchio as pin
 from numpy.linalg import norm
 from scipy.optimize import fmin_slsqp
 
+from supaero2024 import collision_checking
 from supaero2024.load_ur5_with_obstacles import Target, load_ur5_with_obstacles
 from supaero2024.meshcat_viewer_wrapper import MeshcatVisualizer
 
@@ -89,6 +90,31 @@ def collisionDistance(q):
     return robot.collision_data.distanceResults[idx].min_distance
 
 
+# %end_jupyter_snippet
+
+
+# %jupyter_snippet grad
+def endefJacobian(q):
+    """Return the 2xnq Jacobian of the end effector position (2d)."""
+    J = pin.computeFrameJacobian(
+        robot.model, robot.data, q, robot.model.nframes - 1, pin.LOCAL_WORLD_ALIGNED
+    )
+    return J[[0, 2]]
+
+
+def distGradient(q):
+    """Return the gradient of dist(q)."""
+    e = endef(q) - target.position
+    return e @ endefJacobian(q) / norm(e)
+
+
+def collisionDistanceGradient(q):
+    """Return the gradient of collisionDistance(q), see collision_checking."""
+    return collision_checking.collisionDistanceGradient(
+        robot.model, robot.data, robot.collision_model, robot.collision_data, q
+    )
+
+
 # %end_jupyter_snippet
 ################################################################################
 ################################################################################
@@ -215,6 +241,14 @@ def cost(q):
     return dist(q) ** 2
 
 
+def costGradient(q):
+    """
+    Gradient of the cost function. It is computed from the error itself rather
+    than as 2 dist(q) distGradient(q), which is 0/0 at the target.
+    """
+    return 2 * (endef(q) - target.position) @ endefJacobian(q)
+
+
 def constraint(q):
     """
     Constraint function: distance to the obstacle should be positive.
@@ -222,6 +256,13 @@ def constraint(q):
     return collisionDistance(q)
 
 
+def constraintGradient(q):
+    """
+    Jacobian of the constraint function (1xnq matrix).
+    """
+    return collisionDistanceGradient(q)[None, :]
+
+
 def callback(q):
     """
     At each optimization step, display the robot configuration in gepetto-viewer.
@@ -238,7 +279,9 @@ def optimize():
     return fmin_slsqp(
         x0=qrand(check=True),
         func=cost,
+        fprime=costGradient,
         f_ieqcons=constraint,
+        fprime_ieqcons=constraintGradient,
         callback=callback,
         full_output=1,
     )
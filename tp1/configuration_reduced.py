@@ -6,6 +6,7 @@ scipy BFGS.
 # %jupyter_snippet import
 import time
 
+import matplotlib.pylab as plt
 import numpy as np
 from scipy.optimize import fmin_bfgs
 
@@ -13,6 +14,7 @@ from supaero2024.meshcat_viewer_wrapper import MeshcatVisualizer
 from supaero2024.meshcat_viewer_wrapper.transformations import planar, translation2d
 
 # %end_jupyter_snippet
+plt.ion()  # matplotlib with interactive setting
 
 viz = MeshcatVisualizer()  # url="classical"
 
@@ -70,6 +72,65 @@ def cost(q):
 # %end_jupyter_snippet
 
 
+# %jupyter_snippet batch
+def endeffectorBatch(qs):
+    """
+    Return the (N,2) positions of the end effector for the (N,2) configurations qs
+    (or any array of shape (...,2)), without any Python loop.
+    """
+    q1, q12 = qs[..., 0], qs[..., 0] + qs[..., 1]
+    return np.stack([np.cos(q1) + np.cos(q12), np.sin(q1) + np.sin(q12)], axis=-1)
+
+
+def costBatch(qs):
+    """Return the costs of the (N,2) configurations qs."""
+    return np.sum((endeffectorBatch(qs) - target) ** 2, axis=-1)
+
+
+def costGradient(qs):
+    """
+    Return the gradient of the cost, 2 J(q)^T (endeffector(q) - target), for one
+    configuration (2,) or a batch (N,2). The columns of the Jacobian J are the
+    derivatives of the end effector: [-y, x] along q1 and [-s12, c12] along q2.
+    """
+    eff = endeffectorBatch(qs)
+    err = eff - target
+    q12 = qs[..., 0] + qs[..., 1]
+    g1 = -err[..., 0] * eff[..., 1] + err[..., 1] * eff[..., 0]
+    g2 = -err[..., 0] * np.sin(q12) + err[..., 1] * np.cos(q12)
+    return 2 * np.stack([g1, g2], axis=-1)
+
+
+# %end_jupyter_snippet
+
+
+# %jupyter_snippet landscape
+def costLandscape(resolution=200):
+    """
+    Evaluate the cost on a <resolution>x<resolution> grid of [-pi,pi]^2, in one
+    NumPy call. Return the grids of q1, q2 and of the cost.
+    """
+    q1, q2 = np.meshgrid(*[np.linspace(-np.pi, np.pi, resolution)] * 2)
+    return q1, q2, costBatch(np.stack([q1, q2], axis=-1))
+
+
+def plotLandscape(resolution=200):
+    """Plot the level sets of the cost in the configuration space (axis q1,q2)."""
+    q1, q2, costs = costLandscape(resolution)
+    plt.contourf(q1, q2, costs, 50)
+    plt.colorbar()
+    plt.xlabel("q1")
+    plt.ylabel("q2")
+    plt.title("Cost in the configuration space")
+
+
+# %end_jupyter_snippet
+
+# %jupyter_snippet landscape_plot
+plotLandscape()
+# %end_jupyter_snippet
+
+
 # %jupyter_snippet callback
 def callback(q):
     display(q)
@@ -83,3 +144,9 @@ q0 = np.array([0.0, 0.0])
 qopt_bfgs = fmin_bfgs(cost, q0, callback=callback)
 print("\n *** Optimal configuration from BFGS = %s \n\n\n\n" % qopt_bfgs)
 # %end_jupyter_snippet
+
+# %jupyter_snippet optim_grad
+# With the analytic gradient, BFGS does not need finite differences.
+qopt_grad = fmin_bfgs(cost, q0, fprime=costGradient, callback=callback)
+print("\n *** Optimal configuration from BFGS with gradient = %s \n" % qopt_grad)
+# %end_jupyter_snippet
@@ -1,15 +1,19 @@
 """
 Load 4 times the UR5 model, plus a plate object on top of them, to feature a simple
 parallel robot.
-No optimization, this file is just an example of how to load the models.
+The kinematic loop through the tool plate is then closed with LoopClosure.
 """
 
+import time
+import unittest
+
 import numpy as np
 import pinocchio as pin
 
 # %jupyter_snippet 0
 from supaero2024.load_ur5_parallel import load_ur5_parallel
 from supaero2024.meshcat_viewer_wrapper import MeshcatVisualizer
+from supaero2024.parallel_closure import LoopClosure
 
 # Load 4 Ur5 robots, placed at 0.3m from origin in the 4 directions x,y,-x,-y.
 robot = load_ur5_parallel()
@@ -35,3 +39,30 @@ viz.display(robot.q0)
 effector_indexes = [robot.model.getFrameId("tool0_#%d" % i) for i in range(4)]
 robot.framePlacement(robot.q0, effector_indexes[0])
 # %end_jupyter_snippet
+
+# Close the kinematic loop: move the 4 arms so that their effectors are attached
+# to the plate at Mtool, then follow a moving plate.
+# %jupyter_snippet 3
+closure = LoopClosure(robot)
+q = closure.solve(Mtool)
+viz.display(q)
+
+for t in np.arange(0, 2, 1e-2):
+    Mt = pin.SE3(Mtool.rotation, Mtool.translation + [0, 0, 0.05 * np.sin(np.pi * t)])
+    q = closure.solve(Mt)  # Warm started from the previous solution
+    viz.applyConfiguration("world/robot0/toolplate", Mt)
+    viz.display(q)
+    time.sleep(1e-2)
+# %end_jupyter_snippet
+
+
+### TEST ZONE ############################################################
+### Some asserts below to check the behavior of this script in stand-alone
+class ParallelRobotTest(unittest.TestCase):
+    def test_loop_closure(self):
+        for idx, toolMeff in zip(effector_indexes, closure.toolMeffs):
+            Meff = robot.framePlacement(q, idx)
+            self.assertTrue(np.allclose(pin.log(Meff.inverse() * Mt * toolMeff), 0))
+
+
+ParallelRobotTest().test_loop_closure()
@@ -83,6 +83,10 @@ class DisplayCollisionWitnessesInMeshcat:
  
     def displayCollisions(self,geom_data):
         #assert(HPPFCL3X) # Only for 3x versions
+        with self.viz.batch():
+            self._displayCollisions(geom_data)
+
+    def _displayCollisions(self,geom_data):
         self.resetMeshcatObjects(sum([ r.numContacts() for r in geom_data.collisionResults]))
         idx_col = 0
         for collId,r in enumerate(geom_data.collisionResults):
@@ -98,6 +102,10 @@ class DisplayCollisionWitnessesInMeshcat:
                 idx_col += 1
 
     def displayDistances(self,geom_data):
+        with self.viz.batch():
+            self._displayDistances(geom_data)
+
+    def _displayDistances(self,geom_data):
         self.resetMeshcatObjects(len(geom_data.distanceResults))
         idx_col = 0
         for collId,r in enumerate(geom_data.distanceResults):
@@ -79,8 +79,13 @@ class ViewerBicopter:
         '''Display an animation showing a trajectory of a bicopter,
         xs is a list-type object containing bicopter states [x,z,th]
         and timeStep is used to control the lag of the animation. 
+        If the viewer is recording (see MeshcatVisualizer.recording), each state
+        is stored as one frame, without sleeping.
         '''
         import time
         for x in xs:
             self.display(x)
-            time.sleep(timeStep)
+            if self.viz.recorder is not None:
+                self.viz.recorder.nextFrame()
+            else:
+                time.sleep(timeStep)